@@ -26,16 +26,67 @@ with simplicity in mind.
 """
 
 import os
+import sys
 import errno
 import configparser
+import functools
 import time
-from gi.repository import Gtk, GtkSource, Gdk
+from umtelibs import profiler
+
+if __name__ == "__main__" and sys.argv[1:2] == ["--batch"]:
+    # Batch mode never opens a window, so don't even load Gtk.
+    from umtelibs import batch
+    sys.exit(batch.main(sys.argv[2:]))
+
+if __name__ == "__main__":
+    # Hand the files to the umte that's already running, if there is one.
+    from umtelibs import instance
+    if instance.forward_args(sys.argv):
+        sys.exit(0)
+    profiler.start(sys.argv)
+profiler.begin("imports")
+from gi.repository import Gtk, GtkSource, Gdk, GLib
+import xdg.BaseDirectory
 from umtelibs import config
-from umtelibs.terminal import Term
+from umtelibs import resources
+from umtelibs.loader import FileLoader
+from umtelibs.largefile import LargeFileView
+from umtelibs.saver import Saver, ensure_newline
+from umtelibs.encoding import BinaryFileError, FileFormat, detect_file_format
+from umtelibs.tabs import Tab, TabManager
+from umtelibs.session import Session, SessionFile
+from umtelibs import journal
+from umtelibs import textops
+from umtelibs.search import Search
+from umtelibs.replace import ReplaceAll
+from umtelibs.transform import Transform, LINE_TRANSFORMS
+from umtelibs.events import EventBus
+from umtelibs.languages import LanguageResolver
+from umtelibs.highlight import WindowHighlighter
+profiler.end()
+
+
+def tab_attribute(name):
+    """Make an attribute that refers to the current tab's attribute."""
+    return property(lambda self: getattr(self.tabs.current, name),
+                    lambda self, value: setattr(self.tabs.current, name, value))
 
 
 class umte(object):
 
+    # Everything about the document lives in its tab, these let the rest
+    # of umte keep using self.buff, self.path and so on for the current one.
+    buff = tab_attribute('buff')
+    text_area = tab_attribute('text_area')
+    document = tab_attribute('document')
+    path = tab_attribute('path')
+    filename = tab_attribute('filename')
+    title = tab_attribute('title')
+    file_format = tab_attribute('file_format')
+    change_count = tab_attribute('change_count')
+    loader = tab_attribute('loader')
+    large_view = tab_attribute('large_view')
+
     def __init__(self):
         # Some information about the program
         # This will be used in the about_dialog
@@ -45,14 +96,17 @@ class umte(object):
         self.comments = "comments"
         self.license = "GNU GPLv3"
         self.license_type = Gtk.License.GPL_3_0
-        self.icon = Gtk.Image.new_from_file("icons/umte-128.png").get_pixbuf()
+        # Only decoded when the about dialog is first shown.
+        self.icon = None
 
-        self.path = None
-        self.title = 'untitled - ' + self.name
+        self.saver = Saver()
+        # The instance.Server other umtes send their files to.
+        self.server = None
 
         # Load the ui from the glade file
+        profiler.begin("builder")
         self.builder = Gtk.Builder()
-        self.builder.add_from_file("ui/umte.glade")
+        resources.load_ui(self.builder, "umte.glade", self.name)
         
         # Connect the handlers to their callback functions.
         handler = {
@@ -72,14 +126,27 @@ class umte(object):
             "on_select_all_item_activate" : self.on_select_all_item_activate,
             "on_insert_date_item_activate" : self.on_insert_date_item_activate,
             "on_change_case_item_activate" : self.on_change_case_item_activate,
+            "on_trim_item_activate" : self.on_trim_item_activate,
+            "on_expand_tabs_item_activate" : self.on_expand_tabs_item_activate,
+            "on_indent_with_tabs_item_activate" : self.on_indent_with_tabs_item_activate,
+            "on_newlines_item_activate" : self.on_newlines_item_activate,
             "on_find_rep_item_activate" : self.on_find_rep_item_activate,
+            "on_find_entry_changed" : self.on_find_entry_changed,
+            "on_find_entry_activate" : self.on_find_entry_activate,
+            "on_replace_all_button_clicked" : self.on_replace_all_button_clicked,
             "on_linenumber_item_toggled" : self.on_linenumber_item_toggled,
             "on_about_item_activate" : self.on_about_item_activate,
-            "on_terminal_item_toggled" : self.on_terminal_item_toggled
+            "on_terminal_item_toggled" : self.on_terminal_item_toggled,
+            "on_run_item_activate" : self.on_run_item_activate
                 }
         self.builder.connect_signals(handler)
+        profiler.end()
 
+        profiler.begin("widgets")
         self.add_text_area()
+        # Sends the changes made to buffers to whatever follows them,
+        # once per frame.
+        self.edit_events = EventBus(self.tabs.notebook)
         self.add_terminal_area()
         self.create_clipboard()
 
@@ -91,51 +158,74 @@ class umte(object):
         self.find_rep_box = self.builder.get_object("find_rep_box")
         self.find_entry = self.builder.get_object("find_entry")
         self.replace_entry = self.builder.get_object("replace_entry")
+        self.find_count_label = self.builder.get_object("find_count_label")
         self.statusbar = self.builder.get_object("statusbar1")
 
+        self.search = Search(self.on_search_count)
+
         # Load the statusbar manager
         self.status_manager = StatusbarManager(self.statusbar)
-        self.status_manager.update_statusbar(self.buff)
+
+        self.edit_events.connect("title", self.update_modified_title)
+        self.edit_events.connect("undo", self.update_undo_items)
+        self.edit_events.connect("statusbar", self.update_statusbar)
+        profiler.end()
 
         # load the language manager
-        self.lang_manager = GtkSource.LanguageManager()
+        with profiler.phase("language manager"):
+            self.lang_manager = GtkSource.LanguageManager()
+            self.languages = LanguageResolver(self.name, self.lang_manager)
         
         #self.statusbar_syntax_combobox()
 
         # Load the config
-        #self.config = config.Config(self.name)
+        with profiler.phase("config and session"):
+            self.config = config.Config(self.name)
+            self.config.connect(self.on_config_changed)
+            self.check_config()
+            self.session = Session(self.name)
 
         # Show the window and its children
+        profiler.begin("show window")
         self.win = self.builder.get_object("window1")
+        self.new_file()
         self.win.show_all()
         self.terminal_area.hide()
-        self.set_title(self.title)
+        profiler.end()
+        if profiler.is_running():
+            self.first_draw_id = self.win.connect_after("draw",
+                                                        self.on_first_draw)
         
         #self.menubar.hide()
 
     def add_text_area(self):
-        """Add a GtkSource View to the window."""
-        self.text_area = GtkSource.View()
-        # Add the text area to a scrolled window
-        self.scroll1 = Gtk.ScrolledWindow()
-        self.scroll1.add(self.text_area)
-        self.buff = GtkSource.Buffer()
-        self.buff.connect('changed', self.on_text_changed)
-        self.text_area.set_buffer(self.buff)
-        # Add the text area to the box from the glade file
+        """Add the notebook that holds the tabs to the window."""
+        self.tabs = TabManager(self.on_tab_activated)
+        # Add the notebook to the box from the glade file
         self.main_box = self.builder.get_object("main_box")
-        self.main_box.pack_start(self.scroll1, True, True, 0)
+        self.main_box.pack_start(self.tabs.notebook, True, True, 0)
         
-        # Reposition self.scroll1 so it's above the statusbar.
-        self.main_box.reorder_child(self.scroll1, 1)
+        # Reposition the notebook so it's above the statusbar.
+        self.main_box.reorder_child(self.tabs.notebook, 1)
+
+    def create_text_area(self, tab):
+        """Make the buffer and view of a tab the first time it's shown."""
+        tab.create_text_area()
+        tab.buff.connect('changed', self.on_text_changed, tab)
+        tab.text_area.set_show_line_numbers(self.linenum_check.get_active())
 
     def add_terminal_area(self):
-        """Add a ScrolledWindow for terminal to the window."""
-        self.terminal_area = Gtk.ScrolledWindow()
-        self.terminal = Term("/bin/bash")
-        self.terminal_area.add(self.terminal)
+        """
+        Add a box for the terminal to the window. The terminal itself is
+        made the first time it's shown.
+        """
+        self.terminal_area = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        self.terminal = None
+        self.terminal_pane = None
         self.main_box.pack_start(self.terminal_area, True, True, 0)
         self.main_box.reorder_child(self.terminal_area, 2)
+        # The output of the Run item, made the first time it's used.
+        self.run_pane = None
 
     def statusbar_syntax_combobox(self):
         """
@@ -147,7 +237,6 @@ class umte(object):
         """
         self.status_box = self.statusbar.get_message_area()
         languages = self.lang_manager.get_language_ids()
-        print(languages)
 
         self.language_combobox = Gtk.ComboBoxText()
         self.language_combobox.set_entry_text_column(0)
@@ -185,66 +274,161 @@ class umte(object):
 
         save_dialog.destroy()
     
-    def write_file(self, file_path):
-        try:
-            _file = open(file_path, 'w', encoding='utf-8')
-        except IOError:
-            self.error("Unable to save" + file_path, "Check that you have proper permissions")
-            self.path = None
-            self.filename = None
-            return
-        
-        # Get the text from the buffer and add a \n to it
-        start, end = self.buff.get_bounds()
-        text = self.buff.get_text(start, end, False) + "\n"
-        # Write to the file and close it
-        _file.write(text)
-        _file.close()
-        # 
-        self.buff.set_modified(False)
+    def write_file(self, file_path, on_saved=None, tab=None):
+        """
+        Save the buffer of tab, the current one if it's None, to
+        file_path in the background. on_saved(tab) is called if it's
+        saved without anything having changed meanwhile.
+
+        A snapshot of the document is handed to a worker thread, which
+        streams it to a temporary file that then replaces file_path, so
+        a crash while saving can't lose the old file. Typing can carry
+        on while the file is being written.
+        """
+        if tab is None:
+            tab = self.tabs.current
+        # Taking a snapshot doesn't copy any text.
+        snapshot = tab.document.snapshot()
+
+        self.saver.save_in_background(file_path,
+                lambda: ensure_newline(snapshot.iter_chunks()),
+                functools.partial(self.on_file_written, tab, file_path,
+                                  tab.change_count, on_saved),
+                tab.file_format)
+
+    def on_file_written(self, tab, file_path, change_count, on_saved,
+                        written, error):
+        """Called from the main loop when a background save is over."""
+        if not self.tabs.is_open(tab) or file_path != tab.path:
+            # The file was closed or another one opened while saving.
+            if error is not None:
+                self.error("Unable to save " + file_path, str(error))
+            return False
+
+        if isinstance(error, UnicodeEncodeError):
+            # The file is still there, it's only the text that can't be
+            # written in its encoding.
+            self.ask_save_as_utf8(tab, file_path, on_saved, error)
+            return False
+        if error is not None:
+            self.error("Unable to save " + file_path, "Check that you have proper permissions")
+            tab.path = None
+            tab.filename = None
+            return False
+
+        if tab.journal is not None:
+            tab.journal.path = tab.path
+            tab.journal.file_format = tab.file_format
+
+        # If the buffer was edited while the save was running, what's on
+        # the disk is already out of date, so leave it marked modified.
+        if change_count == tab.change_count:
+            tab.buff.set_modified(False)
+            # The file on disk is what the journal starts from now.
+            if tab.journal is not None:
+                tab.journal.reset_to_file()
 
-        # Add the filename to the window's title
-        # Remove the modification status from the title since the file has been saved.
-        self.title = self.filename + ' - ' + self.name
-        self.set_title(self.title)
+            # Add the filename to the window's title
+            # Remove the modification status from the title since the file has been saved.
+            tab.title = tab.filename + ' - ' + self.name
+            self.update_tab_title(tab)
+            if on_saved is not None:
+                on_saved(tab)
+        elif tab.journal is not None:
+            # The file the journal was based on has been replaced, so
+            # base it on a snapshot instead.
+            tab.journal.compact()
+        return False
     
+    def ask_save_as_utf8(self, tab, file_path, on_saved, error):
+        """
+        Tell the user which character tab's encoding can't hold and offer
+        to save the file as UTF-8 instead.
+        """
+        character = error.object[error.start:error.end]
+        dialog = Gtk.MessageDialog(self.win,
+                Gtk.DialogFlags.MODAL|Gtk.DialogFlags.DESTROY_WITH_PARENT,
+                Gtk.MessageType.WARNING,
+                Gtk.ButtonsType.NONE,
+                "Unable to save " + file_path)
+        dialog.format_secondary_text(
+            "{!r} can't be written in {}. Do you want to save the file as "
+            "UTF-8 instead?".format(character, error.encoding))
+        dialog.add_buttons(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL)
+        dialog.add_buttons("Save as UTF-8", Gtk.ResponseType.ACCEPT)
+        response = dialog.run()
+        dialog.destroy()
+        if response == Gtk.ResponseType.ACCEPT and self.tabs.is_open(tab) \
+                and tab.path == file_path:
+            tab.file_format = FileFormat('utf-8', tab.file_format.newline)
+            self.write_file(file_path, on_saved, tab)
+
     def set_title(self, title):
         """Set the title of the window to title."""
         self.win.set_title(title)
+        self.tabs.current.update_label()
+
+    def update_tab_title(self, tab):
+        """Update tab's label, and the window's title if it's the current tab."""
+        tab.update_label()
+        if tab is self.tabs.current:
+            self.win.set_title(tab.title)
     
     def close_file(self):
         """
-        Clear the buffer, reset the title, and reset the 
-        buffer's modification status.
+        Close the current tab. If it was the last one, a new untitled
+        tab takes its place.
         """
-        self.buff.set_text("")
-        self.buff.set_modified(False)
-        self.title = 'untitled - ' + self.name
-        self.set_title(self.title)
+        self.close_tab(self.tabs.current)
+
+    def close_tab(self, tab):
+        if tab.loader is not None:
+            # Nothing of the half loaded text is kept, so it mustn't be
+            # highlighted or journaled.
+            tab.loader.cancel(notify=False)
+            tab.loader = None
+        if tab.replace_all is not None:
+            tab.replace_all.cancel()
+        if self.search.tab is tab:
+            self.search.cancel()
+        self.stop_highlighting(tab)
+        self.stop_journal(tab)
+        self.close_large_file(tab)
+        self.tabs.remove_tab(tab)
+
+        if self.tabs.current is None:
+            self.new_file()
     
-    def on_text_changed(self, widget, data=None):
-        """This will check for a few things everytime the buffer is modified."""
-        """if self.buff.can_undo() is False:
-            self.undo_item.set_sensitive(False)
-        else:
-            self.undo_item.set_sensitive(True)
+    def on_text_changed(self, widget, tab):
+        """
+        Called for every change to a buffer. The listeners of
+        self.edit_events hear about it once, with the next frame.
+        """
+        self.edit_events.notify(tab)
 
-        if self.buff.can_redo() is False:
-            self.redo_item.set_sensitive(False)
-        else:
-            self.redo_item.set_sensitive(True)
+    def update_modified_title(self, event):
+        """
+        Put a * in a tab's title once its document is modified, whether
+        or not it's the current tab, since a replace all can finish in
+        the background.
         """
-        # Print the position of the cursor
-        #print(self.buff.get_property('cursor-position'))
-        self.undo_item.set_sensitive(True)
+        tab = event.tab
+        if tab.loader is not None:
+            # Text going in from the file isn't a modification.
+            return
+        if tab.get_modified() and not tab.title.startswith('*'):
+            tab.title = '*' + tab.title
+            self.update_tab_title(tab)
 
-        if self.buff.get_modified() is True:
-            if self.title[0] != '*':
-                self.title = '*' + self.title
-                self.set_title(self.title)
+    def update_undo_items(self, event):
+        if event.tab is not self.tabs.current:
+            return
+        self.undo_item.set_sensitive(self.buff.can_undo())
+        self.redo_item.set_sensitive(self.buff.can_redo())
 
-        # Update the statusbar with the latest information
-        self.status_manager.update_statusbar(self.buff)
+    def update_statusbar(self, event):
+        if event.tab is self.tabs.current:
+            self.status_manager.queue_update()
     
     def open_file(self):
         """Open a file from disk"""
@@ -257,37 +441,11 @@ class umte(object):
         response = open_dialog.run()
         if response == Gtk.ResponseType.OK:
             # If the user pressed OK
-            # Get the path and filename
-            self.path = open_dialog.get_filename()
-            self.filename = os.path.basename(self.path)
-
-            # Add the filename to the window's title
-            self.title = self.filename + " - " + self.name
-            self.set_title(self.title)
+            # Get the path
+            file_path = open_dialog.get_filename()
 
-            # Add the contents of the file to the buffer
-            try:
-                _file = open(self.path, 'r', encoding='utf-8')
-            except IOError:
-                self.error("Unable to open" + self.path, "Check that you have proper permissions")
-                self.path = None
-                self.filename = None
-                open_dialog.destroy()
-                return
-
-            self.buff.begin_not_undoable_action()
-            self.buff.set_text(_file.read())
-            self.buff.end_not_undoable_action()
-            _file.close()
-
-            ### syntax highlighting ###
-            # Figure out what kind of syntax we need to highlight
-            language =  self.lang_manager.guess_language(self.path, None) 
-            self.buff.set_language(language)
-            print(self.lang_manager.get_language_ids())
-
-            self.buff.set_modified(False)
             open_dialog.destroy()
+            self.open_path(file_path)
 
         elif response == Gtk.ResponseType.CANCEL:
             # The user clicked CANCEL
@@ -295,11 +453,409 @@ class umte(object):
 
         open_dialog.destroy()
 
+    def restore_session(self):
+        """
+        Open the files from the last session.
+
+        The file that was being shown is opened first. The rest are
+        added as unloaded tabs one at a time when the main loop is idle,
+        so they don't hold up the window showing up.
+        """
+        files, active = self.session.load()
+        if not files:
+            self.recover_journals()
+            return
+
+        self.open_path(files[active].path, restore=files[active])
+        # Tabs before the active one go in front of it.
+        others = [(i, files[i]) for i in range(len(files)) if i != active]
+        GLib.idle_add(self.restore_next_tab, iter(others), active,
+                      priority=GLib.PRIORITY_LOW)
+
+    def restore_next_tab(self, others, active):
+        """Add the next tab of the session, called when idle."""
+        try:
+            i, session_file = next(others)
+        except StopIteration:
+            # Recover crashed documents once the session's tabs are all
+            # there, so they don't end up with two tabs for one file.
+            self.recover_journals()
+            return False
+        if self.tabs.find_tab(session_file.path) is None:
+            tab = Tab(session_file.path)
+            tab.restore = session_file
+            tab.language = session_file.language
+            tab.title = tab.filename + " - " + self.name
+            tab.update_label()
+            self.tabs.add_tab(tab, False, i if i < active else -1)
+        return True
+
+    def save_session(self):
+        """Remember the open files for next time."""
+        files = []
+        active = 0
+        for tab in self.tabs.get_tabs():
+            if tab.path is None:
+                continue
+            if tab is self.tabs.current:
+                active = len(files)
+            files.append(self.get_session_file(tab))
+        self.session.save(files, active)
+
+    def get_session_file(self, tab):
+        """Return a SessionFile describing tab."""
+        if not tab.is_loaded() or tab.loader is not None \
+                or tab.large_view is not None:
+            # Keep what it was restored with, if anything.
+            if tab.restore is not None:
+                return tab.restore
+            return SessionFile(tab.path, language=tab.language)
+
+        cursor = tab.buff.get_iter_at_mark(tab.buff.get_insert())
+        rect = tab.text_area.get_visible_rect()
+        top, line_top = tab.text_area.get_line_at_y(rect.y)
+        language = tab.buff.get_language()
+        if language is not None:
+            language = language.get_id()
+        return SessionFile(tab.path, cursor.get_offset(), top.get_line(),
+                           language, tab.file_format)
+
+    def restore_position(self, tab):
+        """Put the cursor and the view back where the session had them."""
+        restore = tab.restore
+        tab.restore = None
+        cursor = tab.buff.get_iter_at_offset(restore.cursor)
+        tab.buff.place_cursor(cursor)
+        # Scroll with a mark, so it happens once the lines are laid out.
+        top = tab.buff.get_iter_at_line(restore.top_line)
+        mark = tab.buff.create_mark(None, top, True)
+        tab.text_area.scroll_to_mark(mark, 0.0, True, 0.0, 0.0)
+        tab.buff.delete_mark(mark)
+
+    def open_path(self, file_path, switch=True, restore=None):
+        """
+        Open file_path in a tab and return the tab.
+
+        If switch is False the tab is opened in the background and isn't
+        loaded until it's shown. An empty untitled tab is reused. restore
+        is the session.SessionFile to restore the tab from, if any.
+        """
+        tab = self.tabs.find_tab(file_path)
+        if tab is not None:
+            if switch:
+                self.tabs.set_current(tab)
+            return tab
+
+        current = self.tabs.current
+        if switch and current is not None and current.is_blank() \
+                and current.is_loaded():
+            current.path = file_path
+            current.filename = os.path.basename(file_path)
+            if restore is not None:
+                current.restore = restore
+                current.language = restore.language
+            self.load_file(current)
+            return current
+
+        tab = Tab(file_path)
+        if restore is not None:
+            tab.restore = restore
+            tab.language = restore.language
+        tab.title = tab.filename + " - " + self.name
+        tab.update_label()
+        self.tabs.add_tab(tab, switch)
+        return tab
+
+    def open_files(self, files):
+        """
+        Open every file in files, a list of (path, line, column) like
+        instance.parse_file_args returns. Only the first one is loaded
+        right away, the others wait until their tab is shown.
+        """
+        for i, (file_path, line, column) in enumerate(files):
+            tab = self.open_path(os.path.abspath(file_path), switch=(i == 0))
+            if line is not None:
+                tab.goto = (line, column)
+                if tab.is_loaded() and tab.loader is None:
+                    self.goto_position(tab)
+
+    def open_remote_files(self, files):
+        """Open the files another umte sent, and come to the front."""
+        if files:
+            self.open_files(files)
+        self.win.present()
+
+    def goto_position(self, tab):
+        """Put the cursor at tab.goto, the line and column to go to."""
+        line, column = tab.goto
+        tab.goto = None
+        if tab.large_view is not None:
+            tab.large_view.scroll_to_line(line - 1)
+            return
+        line = min(max(line, 1), tab.buff.get_line_count()) - 1
+        cursor = tab.buff.get_iter_at_line(line)
+        if column is not None and column > 1:
+            cursor.forward_chars(min(column - 1, cursor.get_chars_in_line()))
+            if cursor.get_line() != line:
+                # Went past the end of the line.
+                cursor = tab.buff.get_iter_at_line(line)
+                cursor.forward_to_line_end()
+        tab.buff.place_cursor(cursor)
+        tab.text_area.scroll_to_mark(tab.buff.get_insert(), 0.0,
+                                     True, 0.0, 0.5)
+
+    def on_tab_activated(self, tab):
+        """Called when tab is brought to the front."""
+        if not tab.is_loaded():
+            self.create_text_area(tab)
+            if tab.path is not None:
+                self.load_file(tab)
+            else:
+                self.start_journal(tab)
+
+        self.win.set_title(tab.title)
+        tab.update_label()
+        self.status_manager.set_stats(tab.stats)
+        if tab.loader is not None:
+            self.status_manager.show_progress("Loading " + tab.filename,
+                                              self.on_load_cancel)
+            self.status_manager.set_progress(tab.loader.get_fraction())
+        elif tab.replace_all is not None:
+            if isinstance(tab.replace_all, Transform):
+                text = "Transforming"
+            else:
+                text = "Replacing"
+            self.status_manager.show_progress(text, self.on_replace_cancel)
+        else:
+            self.status_manager.hide_progress()
+        if self.find_rep_box.get_visible() and tab.replace_all is None:
+            self.search.start(tab, self.find_entry.get_text())
+        tab.text_area.grab_focus()
+
+    def load_file(self, tab):
+        """
+        Load the file at tab.path into tab's buffer in the background.
+
+        The file is streamed into the buffer a chunk at a time, with the
+        progress shown in the statusbar along with a button to cancel it.
+        """
+        file_path = tab.path
+        if tab.loader is not None:
+            tab.loader.cancel(notify=False)
+            tab.loader = None
+        self.stop_journal(tab)
+        self.stop_highlighting(tab)
+        self.close_large_file(tab)
+
+        # Work out the encoding and line endings from the start of the
+        # file, and refuse binary files before anything gets loaded. A
+        # restored file already knows them.
+        try:
+            if tab.restore is not None and tab.restore.file_format is not None:
+                file_format = tab.restore.file_format
+            else:
+                file_format = detect_file_format(file_path)
+        except (BinaryFileError, IOError) as e:
+            self.error("Unable to open " + file_path, str(e))
+            tab.path = None
+            tab.filename = None
+            tab.title = 'untitled - ' + self.name
+            self.update_tab_title(tab)
+            return
+        tab.file_format = file_format
+
+        tab.filename = os.path.basename(file_path)
+        # Add the filename to the window's title
+        tab.title = tab.filename + " - " + self.name
+        self.update_tab_title(tab)
+
+        # Really big files go to the read-only large file viewer instead.
+        large_file_size = self.config.files.large_file_size
+        try:
+            if os.path.getsize(file_path) >= large_file_size * 1024 * 1024:
+                self.open_large_file(tab)
+                return
+        except OSError:
+            # Let the loader report it below.
+            pass
+
+        tab.loader = FileLoader(tab.buff, file_path, tab.file_format,
+                on_progress=functools.partial(self.on_load_progress, tab),
+                on_done=functools.partial(self.on_load_done, tab),
+                on_error=functools.partial(self.on_load_error, tab))
+        try:
+            tab.loader.start()
+        except IOError:
+            tab.loader = None
+            self.error("Unable to open " + file_path, "Check that you have proper permissions")
+            tab.path = None
+            tab.filename = None
+            return
+
+        # Don't let the user type into a half loaded file.
+        tab.text_area.set_editable(False)
+        if tab is self.tabs.current:
+            self.status_manager.show_progress("Loading " + tab.filename,
+                                              self.on_load_cancel)
+
+    def open_large_file(self, tab):
+        """Show the file at tab.path in the read-only large file viewer."""
+        try:
+            tab.large_view = LargeFileView(tab.path, tab.file_format)
+        except (IOError, ValueError) as e:
+            self.error("Unable to open " + tab.path, str(e))
+            tab.path = None
+            tab.filename = None
+            return
+
+        # The viewer only ever holds what's on screen, so that's all
+        # that gets highlighted.
+        tab.large_view.buff.set_language(self.languages.get_language(tab.path))
+        tab.buff.set_text("")
+        tab.buff.set_modified(False)
+        tab.scroll.hide()
+        tab.page.pack_start(tab.large_view, True, True, 0)
+        tab.large_view.show_all()
+        tab.title = tab.filename + " (read-only) - " + self.name
+        self.update_tab_title(tab)
+        if tab.goto is not None:
+            self.goto_position(tab)
+
+    def close_large_file(self, tab):
+        """Close tab's large file viewer and bring back its text area."""
+        if tab.large_view is None:
+            return
+        tab.large_view.close()
+        tab.large_view.destroy()
+        tab.large_view = None
+        tab.scroll.show()
+
+    def finish_loading(self, tab):
+        """Clean up after the loader, whether it finished or not."""
+        tab.loader = None
+        tab.text_area.set_editable(True)
+        if tab is self.tabs.current:
+            self.status_manager.hide_progress()
+        tab.buff.set_modified(False)
+        self.update_tab_title(tab)
+
+    def on_load_progress(self, tab, fraction):
+        if tab is self.tabs.current:
+            self.status_manager.set_progress(fraction)
+
+    def on_load_done(self, tab):
+        ### syntax highlighting ###
+        # Use the tab's language if it has one, otherwise figure out what
+        # kind of syntax we need to highlight
+        if tab.language is not None:
+            language = self.lang_manager.get_language(tab.language)
+        else:
+            language = self.languages.get_language(tab.path)
+        self.set_language(tab, language)
+
+        # The loader falls back on latin-1 if the file isn't UTF-8 after all.
+        tab.file_format = tab.loader.file_format
+        # Only a complete file can be the base of the journal.
+        loaded = not tab.loader.cancelled
+        self.finish_loading(tab)
+        if not loaded:
+            # Only the start of the file is in the buffer, so it mustn't
+            # be saved over the file.
+            tab.path = None
+            tab.filename = tab.filename + " (partial)"
+            tab.title = tab.filename + " - " + self.name
+            self.update_tab_title(tab)
+        self.start_journal(tab, loaded)
+        if tab.restore is not None:
+            self.restore_position(tab)
+        if tab.goto is not None:
+            self.goto_position(tab)
+
+    def set_language(self, tab, language):
+        """
+        Highlight tab's buffer as language. Big buffers are highlighted
+        around what's on screen rather than all at once.
+        """
+        self.stop_highlighting(tab)
+        size = tab.stats.chars / (1024 * 1024)
+        if language is None or \
+                size < self.config.files.highlight_size:
+            tab.buff.set_language(language)
+            return
+        tab.buff.set_language(None)
+        fill = size < self.config.files.offscreen_highlight_size
+        tab.highlighter = WindowHighlighter(tab.text_area, tab.buff,
+                                            language, fill)
+
+    def stop_highlighting(self, tab):
+        if tab.highlighter is not None:
+            tab.highlighter.stop()
+            tab.highlighter = None
+
+    def on_load_error(self, tab, exception):
+        self.finish_loading(tab)
+        self.error("Unable to open " + tab.path, str(exception))
+        self.close_tab(tab)
+
+    def start_journal(self, tab, loaded=True):
+        """
+        Start journaling tab's edits, so they can be recovered if umte
+        crashes. loaded should be True if the buffer holds exactly what's
+        in the file at tab.path.
+        """
+        self.stop_journal(tab)
+        tab.journal = journal.Journal(self.name, tab.buff, tab.document)
+        tab.journal.start(tab.path, tab.file_format, loaded)
+
+    def stop_journal(self, tab):
+        """Stop journaling tab and remove its journal."""
+        if tab.journal is not None:
+            tab.journal.discard()
+            tab.journal = None
+
+    def recover_journals(self):
+        """
+        Open the unsaved text left behind by a umte that crashed, each in
+        its own tab.
+        """
+        for meta_file in journal.find_orphans(self.name):
+            try:
+                path, file_format, text = journal.recover(meta_file)
+            except (IOError, OSError, ValueError, KeyError) as e:
+                print("Unable to recover " + meta_file + ": " + str(e))
+                continue
+            self.open_recovered(path, file_format, text)
+            journal.remove_orphan(meta_file)
+        return False
+
+    def open_recovered(self, path, file_format, text):
+        """Open text recovered from a journal in a new tab."""
+        name = os.path.basename(path) if path is not None else "untitled"
+        if path is not None and self.tabs.find_tab(path) is not None:
+            # Don't have two tabs saving to the same file.
+            path = None
+        tab = Tab(path)
+        tab.file_format = file_format
+        self.create_text_area(tab)
+        tab.buff.begin_not_undoable_action()
+        tab.buff.set_text(text)
+        tab.buff.end_not_undoable_action()
+        tab.buff.set_modified(True)
+        tab.title = "*" + name + " (recovered) - " + self.name
+        self.start_journal(tab, False)
+        self.tabs.add_tab(tab)
+
+    def on_load_cancel(self, widget, data=None):
+        """Stop loading the file, keeping what has been read so far."""
+        if self.loader is not None:
+            self.loader.cancel()
+
     def new_file(self):
-        """Close the currently open file and start a new file"""
-        # In this program, creating a new file is the same as closing the
-        # current one, so just run the self.close_file() function
-        self.close_file()
+        """Open a new untitled tab."""
+        tab = Tab()
+        tab.title = 'untitled - ' + self.name
+        tab.update_label()
+        self.tabs.add_tab(tab)
     
     """def check_for_save(self):
 
@@ -343,6 +899,8 @@ class umte(object):
         ab_dialog.set_copyright(self.copyright_string)
         ab_dialog.set_comments(self.comments)
         ab_dialog.set_license_type(self.license_type)
+        if self.icon is None:
+            self.icon = resources.load_pixbuf("icons", "umte-128.png")
         ab_dialog.set_logo(self.icon)
 
         ab_dialog.run()
@@ -372,56 +930,27 @@ class umte(object):
         """
         Take the selection (text) and cycle it through different cases.
 
-        Similar to the extremely useful feature in Microsoft Word, 
-        take text, which will be the user's selected text and cycle it 
-        through being uppercase, lowercase and title format each time
-        the user runs this function and return the result.
+        See umtelibs.textops.change_case.
         """
-        if text.istitle():
-            newtext = text.upper()
-
-        elif text.isupper():
-            newtext = text.lower()
-
-        elif text.islower():
-            newtext = text.title()
-
-        return(newtext)
+        return(textops.change_case(text))
 
     
     def check_config(self):
         """Read the config's values and customize the program to what it specifies."""
         # Line numbers
-        if self.config.read_config("view", "linenumbers") == 'yes':
-            # If the config says linenumbers should be shown
-            pass
+        self.linenum_check.set_active(self.config.view.linenumbers)
+
+    def on_config_changed(self, section, _property, value):
+        """Apply a setting that was changed while umte is running."""
+        if (section, _property) == ("view", "linenumbers"):
+            self.linenum_check.set_active(value)
 
     
     # callback methods
     def on_new_file_activate(self, widget, data=None):
-        if self.buff.get_modified() == True:
-            # If the buffer has been modified
-            dialog = Gtk.MessageDialog(self.win,
-                    Gtk.DialogFlags.MODAL|Gtk.DialogFlags.DESTROY_WITH_PARENT,
-                    Gtk.MessageType.WARNING,
-                    Gtk.ButtonsType.NONE,
-                    "There are unsaved changes.")
-            dialog.format_secondary_text("Before you open a new file, do you want to save changes?")
-            # Add some buttons
-            dialog.add_buttons(Gtk.STOCK_CANCEL, 42)
-            dialog.add_buttons(Gtk.STOCK_SAVE, 43)
-
-            response = dialog.run()
-            if response == 42:
-                pass
-            elif response == 43:
-                self.on_save_item_activate(None)
-                self.new_file()
-
-            dialog.destroy()
-        else:
-            # If the buffer hasn't been modified, just run the new_file() function.
-            self.new_file()
+        # The current file stays open in its own tab, so there's nothing
+        # to save first.
+        self.new_file()
 
     def on_open_item_activate(self, widget, data=None):
         self.open_file()
@@ -431,12 +960,24 @@ class umte(object):
         if the current file is unsaved, run the save_as function, 
         otherwise just write the file.
         """
+        if self.large_view is not None:
+            self.error("Unable to save " + self.filename, "Large files are opened read-only")
+            return
+        if self.loader is not None:
+            self.error("Unable to save " + self.filename, "It hasn't finished loading")
+            return
         if self.path != None:
             self.write_file(self.path)
         else:
             self.save_as_file()
     
     def on_save_as_item_activate(self, widget, data=None):
+        if self.large_view is not None:
+            self.error("Unable to save " + self.filename, "Large files are opened read-only")
+            return
+        if self.loader is not None:
+            self.error("Unable to save " + self.filename, "It hasn't finished loading")
+            return
         self.save_as_file()
     
     def on_close_file_item_activate(self, widget, data=None):
@@ -444,7 +985,11 @@ class umte(object):
         Close the current file, but prompt the user for save if the buffer has
         been modified.
         """
-        if self.buff.get_modified() == True:
+        if self.loader is not None:
+            # Nothing has been typed into a file that's still loading,
+            # and saving it would cut it short.
+            self.close_file()
+        elif self.buff.get_modified() == True:
             # If the buffer has been modified
             dialog = Gtk.MessageDialog(self.win,
                     Gtk.DialogFlags.MODAL|Gtk.DialogFlags.DESTROY_WITH_PARENT,
@@ -473,19 +1018,37 @@ class umte(object):
 
     
     def on_quit_item_activate(self, widget, data=None):
-        """Stop the Gtk loop when activated."""
+        """Remember the open files and stop the Gtk loop when activated."""
+        self.save_session()
+        self.languages.save()
+        self.config.flush()
+        if self.server is not None:
+            self.server.close()
+        if self.terminal_pane is not None:
+            self.terminal_pane.save_scrollback()
+        # Quitting normally, so there's nothing to recover.
+        for tab in self.tabs.get_tabs():
+            self.stop_journal(tab)
+        if os.environ.get("UMTE_EVENT_TIMINGS"):
+            self.edit_events.report()
         Gtk.main_quit()
     
     def on_undo_item_activate(self, widget, data=None):
         """Undo the last action when activated"""
+        if self.tabs.current.is_busy():
+            return
         self.buff.undo()
     
     def on_redo_item_activate(self, widget, data=None):
         """Redo the last action when activated."""
+        if self.tabs.current.is_busy():
+            return
         self.buff.redo()
 
     def on_cut_item_activate(self, widget, data=None):
         """Cut the selection to the clipboard when activated."""
+        if self.tabs.current.is_busy():
+            return
         self.buff.cut_clipboard(self.clipboard, True)
 
     def on_copy_item_activate(self, widget, data=None):
@@ -494,10 +1057,14 @@ class umte(object):
     
     def on_paste_item_activate(self, widget, data=None):
         """paste the clipboard to the buffer when activated."""
+        if self.tabs.current.is_busy():
+            return
         self.buff.paste_clipboard(self.clipboard, None, True)
     
     def on_delete_item_activate(self, widget, data=None):
         """Delete the current selection when activated."""
+        if self.tabs.current.is_busy():
+            return
         self.buff.delete_selection(True, True)
     
     def on_select_all_item_activate(self, widget, data=None):
@@ -512,42 +1079,210 @@ class umte(object):
             # Give focus to the find_entry when shown
             self.find_entry.set_can_focus(True)
             self.find_entry.grab_focus()
+            self.search.start(self.tabs.current, self.find_entry.get_text())
         elif self.find_rep_box.get_visible() is True:
             self.find_rep_box.set_visible(False)
+            self.search.cancel()
             # Give focus to the text area when the find menu is hidden
             self.text_area.grab_focus()
 
+    def on_find_entry_changed(self, widget, data=None):
+        """Search as the user types, dropping the last search."""
+        if self.tabs.current.replace_all is None:
+            self.search.start(self.tabs.current, widget.get_text())
+
+    def on_find_entry_activate(self, widget, data=None):
+        """Select the next match when enter is pressed."""
+        self.search.find_next()
+
+    def on_replace_all_button_clicked(self, widget, data=None):
+        """
+        Replace every match of find_entry with replace_entry in the
+        background, as one action that can be undone.
+        """
+        tab = self.tabs.current
+        find = self.find_entry.get_text()
+        if (not find or tab.replace_all is not None or
+                tab.loader is not None or tab.large_view is not None):
+            return
+        self.search.cancel()
+        # No typing while the edits are made.
+        tab.text_area.set_editable(False)
+        tab.replace_all = ReplaceAll(
+            tab.buff, tab.document,
+            functools.partial(self.on_replace_progress, tab),
+            functools.partial(self.on_replace_done, tab))
+        self.status_manager.show_progress("Replacing " + find,
+                                          self.on_replace_cancel)
+        tab.replace_all.start(find, self.replace_entry.get_text())
+
+    def on_replace_progress(self, tab, fraction):
+        if tab is self.tabs.current:
+            self.status_manager.set_progress(fraction)
+
+    def on_replace_done(self, tab, count, cancelled):
+        tab.replace_all = None
+        tab.text_area.set_editable(True)
+        if tab is not self.tabs.current:
+            return
+        self.status_manager.hide_progress()
+        if cancelled:
+            self.find_count_label.set_text("Cancelled")
+        else:
+            self.find_count_label.set_text("{} replaced".format(count))
+
+    def on_replace_cancel(self, widget, data=None):
+        if self.tabs.current.replace_all is not None:
+            self.tabs.current.replace_all.cancel()
+
+    def on_search_count(self, count, finished):
+        if not self.find_entry.get_text():
+            self.find_count_label.set_text("")
+        elif finished:
+            self.find_count_label.set_text("{} matches".format(count))
+        else:
+            self.find_count_label.set_text("{} matches...".format(count))
+
     def on_insert_date_item_activate(self, widget, data=None):
         """Insert the current date in locale format at cursor position into the buffer."""
+        if self.tabs.current.is_busy():
+            return
         date = time.strftime('%x')
         self.buff.insert_at_cursor(date, len(date))
 
     def on_change_case_item_activate(self, widget, data=None):
-        #FIXME find a way to replace the selection with the new text.
-        start, end = self.buff.get_selection_bounds()
-        selection = self.buff.get_text(start, end, False)
-        print(selection)
-        
-       # # Delete the selection and replace it with the new text
-        #self.buff.delete_selection(True, True)
-        self.buff.insert(start, self.change_case(selection), -1)
+        self.transform_selection("case")
 
-    def on_linenumber_item_toggled(self, widget, data=None):
-        if widget.get_active():
-            self.text_area.set_show_line_numbers(True)
-            # Write this change to the config
-            self.config.write_config("view", "linenumbers", "yes")
+    def on_trim_item_activate(self, widget, data=None):
+        self.transform_selection("trim")
+
+    def on_expand_tabs_item_activate(self, widget, data=None):
+        self.transform_selection("expand_tabs")
+
+    def on_indent_with_tabs_item_activate(self, widget, data=None):
+        self.transform_selection("indent_with_tabs")
+
+    def on_newlines_item_activate(self, widget, data=None):
+        self.transform_selection("newlines")
+
+    def transform_selection(self, name):
+        """
+        Replace the selection with it transformed as name, in the
+        background, as one action that can be undone. Everything but
+        changing the case works on whole lines, and on the whole file if
+        nothing is selected.
+        """
+        tab = self.tabs.current
+        if (tab.replace_all is not None or tab.loader is not None or
+                tab.large_view is not None):
+            return
+        bounds = tab.buff.get_selection_bounds()
+        if bounds:
+            start, end = bounds
+        elif name in LINE_TRANSFORMS:
+            start, end = tab.buff.get_bounds()
         else:
-            self.text_area.set_show_line_numbers(False)
-            # Write this change to the config
-            self.config.write_config("view", "linenumbers", "no")
+            return
+        if name in LINE_TRANSFORMS:
+            start.set_line_offset(0)
+            if not end.starts_line():
+                end.forward_to_line_end()
+        self.search.cancel()
+        # No typing while the edits are made.
+        tab.text_area.set_editable(False)
+        # It's kept where a replace all would be, only one can run.
+        tab.replace_all = Transform(
+            tab.buff, tab.document,
+            functools.partial(self.on_replace_progress, tab),
+            functools.partial(self.on_transform_done, tab))
+        self.status_manager.show_progress("Transforming",
+                                          self.on_replace_cancel)
+        tab.replace_all.start(name, start.get_offset(), end.get_offset(),
+                              tab.text_area.get_tab_width())
+
+    def on_transform_done(self, tab, count, cancelled):
+        tab.replace_all = None
+        tab.text_area.set_editable(True)
+        if tab is self.tabs.current:
+            self.status_manager.hide_progress()
+
+    def on_linenumber_item_toggled(self, widget, data=None):
+        for tab in self.tabs.get_tabs():
+            if tab.is_loaded():
+                tab.text_area.set_show_line_numbers(widget.get_active())
+
+        # Write this change to the config
+        self.config.write_config("view", "linenumbers", widget.get_active())
 
     def on_terminal_item_toggled(self, widget, data=None):
         if widget.get_active():
+            if self.terminal is None:
+                self.create_terminal()
             self.terminal_area.show()
         else:
             self.terminal_area.hide()
 
+    def create_terminal(self):
+        """Make the terminal and start a shell in the current file's directory."""
+        profiler.begin("terminal")
+        # Vte is only loaded by the sessions that use the terminal.
+        from umtelibs.terminal import Term, TerminalPane
+        spill_path = None
+        if self.config.terminal.spill_scrollback:
+            spill_path = xdg.BaseDirectory.save_cache_path(self.name,
+                                                           "scrollback")
+        self.terminal = Term("/bin/bash", self.config.terminal.scrollback_lines)
+        self.terminal_pane = TerminalPane(self.terminal, spill_path)
+        self.terminal_area.pack_start(self.terminal_pane, True, True, 0)
+        self.terminal_pane.show_all()
+        directory = None
+        if self.path is not None:
+            directory = os.path.dirname(self.path)
+        self.terminal.spawn(directory)
+        profiler.end()
+
+    def on_run_item_activate(self, widget, data=None):
+        """Run the current file, saving it first if it's been changed."""
+        if self.path is None:
+            self.error("Unable to run this file", "Save it first")
+            return
+        if self.loader is not None:
+            self.error("Unable to run " + self.filename, "It hasn't finished loading")
+            return
+        if self.large_view is None and self.buff.get_modified():
+            self.write_file(self.path, self.run_file)
+        else:
+            self.run_file(self.tabs.current)
+
+    def run_file(self, tab):
+        """Run the file in tab and show its output."""
+        # Like the terminal, only loaded once it's used.
+        from umtelibs import run
+        buff = tab.large_view.buff if tab.large_view is not None else tab.buff
+        language = buff.get_language()
+        command = run.get_command(tab.path, language.get_id()
+                                  if language is not None else None)
+        if command is None:
+            self.error("Unable to run " + tab.filename,
+                       "It has no #! line and its language can't be run")
+            return
+        if self.run_pane is None:
+            self.run_pane = run.OutputPane(self.on_run_location)
+            self.main_box.pack_start(self.run_pane, True, True, 0)
+            self.main_box.reorder_child(self.run_pane, 3)
+        self.run_pane.show_all()
+        self.run_pane.run(command, os.path.dirname(tab.path))
+
+    def on_run_location(self, path, line, column):
+        """Go to a file:line that was clicked in the output of a run."""
+        self.open_files([(path, line, column)])
+
+    def on_first_draw(self, widget, cairo_context):
+        """Report the startup profile once the window has been drawn."""
+        widget.disconnect(self.first_draw_id)
+        profiler.finish()
+        return False
+
     def on_language_combobox_changed(self, widget, data=None):
         """
         When it is changed, get the chosen language and tell self.buff 
@@ -557,7 +1292,10 @@ class umte(object):
         if chosen_language != None:
             print("highlighting: " + chosen_language)
             lang = self.lang_manager.get_language(chosen_language)
-            self.buff.set_language(lang)
+            self.set_language(self.tabs.current, lang)
+            self.tabs.current.language = chosen_language
+            if self.path is not None:
+                self.languages.remember(self.path, chosen_language)
     
     def on_about_item_activate(self, widget, data=None):
         self.show_about_dialog()
@@ -567,22 +1305,99 @@ class StatusbarManager(object):
     """
     A statusbar manager for umte to show useful information.
 
+    The information comes from the umtelibs.stats.DocumentStats of the
+    current tab, and is pushed at most once per frame however many
+    changes are made in between.
     """
-    #TODO statusbar info idea: line: 44, column: 22, Spaces: 4
 
     def __init__(self, statusbar):
         self.statusbar = statusbar
         self.stat_id = self.statusbar.get_context_id("status_id")
+        self.progress_box = None
+        self.stats = None
+        self.tick_id = None
+
+    def create_progress_box(self):
+        """Add a progress bar and a cancel button to the statusbar."""
+        self.progress_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL,
+                                    spacing=4)
+        self.progress_bar = Gtk.ProgressBar()
+        self.progress_bar.set_show_text(True)
+        self.progress_cancel = Gtk.Button.new_with_label("Cancel")
+        self.progress_cancel.set_relief(Gtk.ReliefStyle.NONE)
+        self.progress_cancel.connect("clicked", self.on_progress_cancel_clicked)
+        self.progress_box.pack_start(self.progress_bar, False, False, 0)
+        self.progress_box.pack_start(self.progress_cancel, False, False, 0)
+        self.statusbar.get_message_area().pack_end(self.progress_box,
+                                                   False, False, 0)
+
+    def show_progress(self, text, cancel_callback=None):
+        """
+        Show the progress bar with text on it. cancel_callback is called
+        when the cancel button is clicked, the button is hidden if it's None.
+        """
+        if self.progress_box is None:
+            self.create_progress_box()
+        self.cancel_callback = cancel_callback
+        self.progress_bar.set_text(text)
+        self.progress_bar.set_fraction(0.0)
+        self.progress_box.show_all()
+        self.progress_cancel.set_visible(cancel_callback is not None)
+
+    def set_progress(self, fraction):
+        if self.progress_box is not None:
+            self.progress_bar.set_fraction(fraction)
+
+    def hide_progress(self):
+        if self.progress_box is not None:
+            self.progress_box.hide()
+        self.cancel_callback = None
+
+    def on_progress_cancel_clicked(self, widget, data=None):
+        if self.cancel_callback is not None:
+            self.cancel_callback(widget)
+
+    def set_stats(self, stats):
+        """Show stats, the DocumentStats of the tab that was switched to."""
+        if self.stats is not None:
+            self.stats.on_changed = None
+        self.stats = stats
+        stats.on_changed = self.queue_update
+        self.queue_update()
+
+    def queue_update(self):
+        """Update the statusbar when the next frame is drawn."""
+        if self.tick_id is None:
+            self.tick_id = self.statusbar.add_tick_callback(self.on_tick)
+
+    def on_tick(self, widget, frame_clock):
+        self.tick_id = None
+        self.update_statusbar()
+        return False
 
     def create_status_string(self):
-        self.status_string = " lines: {}  length: {}"\
-            .format(self.line_count, self.char_count)
-
-    def update_statusbar(self, buff):
+        stats = self.stats
+        line, column = stats.get_cursor()
+        self.status_string = " lines: {}  words: {}  length: {}    "\
+            "Ln {}, Col {}".format(stats.lines, stats.words, stats.chars,
+                                   line, column)
+        selection = stats.get_selection()
+        if selection is not None:
+            chars, words, lines = selection
+            if words is None:
+                words = "?"
+            self.status_string += "    selected: {} chars, {} words, "\
+                "{} lines".format(chars, words, lines)
+        indent = stats.get_indent()
+        if indent:
+            self.status_string += "    " + indent
+
+    def update_statusbar(self):
+        """Show the latest stats of the current tab."""
+        if self.stats is None:
+            return
         self.clear_statusbar()
-        self.get_line_amount(buff)
-        self.get_char_amount(buff)
-        
+
         # Update the status string to the latest information
         self.create_status_string()
         # Push it to the statusbar
@@ -592,12 +1407,19 @@ class StatusbarManager(object):
         """Clear the statusbar of all messages"""
         self.statusbar.remove_all(self.stat_id)
 
-    def get_line_amount(self, buff):
-        self.line_count = buff.get_line_count()
-
-    def get_char_amount(self, buff):
-        """Get the amount of characters in the buffer"""
-        self.char_count = buff.get_char_count()
-
-umte = umte()
-Gtk.main()
+if __name__ == "__main__":
+    umte = umte()
+    umte.server = instance.Server(umte.open_remote_files)
+    if not umte.server.start():
+        umte.server = None
+    profiler.begin("open files")
+    files = instance.parse_file_args(sys.argv[1:])
+    if files:
+        umte.open_files(files)
+        GLib.idle_add(umte.recover_journals, priority=GLib.PRIORITY_LOW)
+    else:
+        umte.restore_session()
+    profiler.end()
+    # Ended by on_first_draw.
+    profiler.begin("first draw")
+    Gtk.main()
@@ -0,0 +1,306 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/batch.py
+
+umte --batch: run a script of edits over lots of files without opening
+a window.
+
+    umte --batch -e "replace 'colou?r' 'colour'" -e strip 'src/**/*.txt'
+    umte --batch -f edits.umte -l files.txt -j 8
+
+A script has one operation per line, blank lines and lines starting
+with # are ignored:
+
+    replace PATTERN REPLACEMENT   regular expression replace, per line,
+                                  the newline isn't part of the line
+    case upper|lower|title        change the case of the text
+    strip                         remove whitespace at the end of lines
+    encode ENCODING               save the file in another encoding
+    newline lf|crlf|cr            save the file with other line endings
+
+Files are read a chunk at a time and written atomically, several at a
+time in separate processes. Files that end up the same are left alone.
+"""
+
+import os
+import re
+import sys
+import glob
+import codecs
+import shlex
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from umtelibs import textops
+from umtelibs.encoding import FileFormat, BinaryFileError, detect_file_format
+from umtelibs.saver import save_chunks
+
+# How many bytes of a file are read at a time.
+CHUNK_SIZE = 256 * 1024
+
+NEWLINES = {"lf": "\n", "crlf": "\r\n", "cr": "\r"}
+
+
+def parse_operation(line):
+    """
+    Turn one line of a script into an operation tuple. Raises ValueError
+    if the line doesn't make sense.
+    """
+    words = shlex.split(line)
+    name, args = words[0], words[1:]
+
+    if name == "replace" and len(args) == 2:
+        # Fail now rather than in every worker.
+        re.compile(args[0])
+    elif name == "case" and len(args) == 1:
+        if args[0] not in ("upper", "lower", "title"):
+            raise ValueError("case must be upper, lower or title")
+    elif name == "strip" and len(args) == 0:
+        pass
+    elif name == "encode" and len(args) == 1:
+        codecs.lookup(args[0])
+    elif name == "newline" and len(args) == 1:
+        if args[0] not in NEWLINES:
+            raise ValueError("newline must be lf, crlf or cr")
+    else:
+        raise ValueError("Unknown operation: " + line)
+    return (name,) + tuple(args)
+
+
+def parse_script(lines):
+    """Return the operations of a script, skipping blanks and comments."""
+    operations = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            operations.append(parse_operation(line))
+    return operations
+
+
+def expand_paths(patterns):
+    """Return the regular files matching patterns, in order, without repeats."""
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches and os.path.exists(pattern):
+            matches = [pattern]
+        for path in matches:
+            if os.path.isfile(path) and path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+
+class FileResult(object):
+    """What happened to one file."""
+
+    def __init__(self, path, status, replacements=0, message=""):
+        self.path = path
+        # One of "changed", "unchanged", "skipped" or "error".
+        self.status = status
+        self.replacements = replacements
+        self.message = message
+
+    def __str__(self):
+        line = "{:<10} {:>8}  {}".format(self.status, self.replacements,
+                                         self.path)
+        if self.message:
+            line += "  (" + self.message + ")"
+        return line
+
+
+def read_blocks(path, file_format):
+    """
+    Yield the text of the file at path in blocks of whole lines, with
+    "\\n" line endings.
+    """
+    decoder = file_format.get_decoder()
+    carry = ""
+    with open(path, 'rb') as _file:
+        _file.seek(len(file_format.bom))
+        while True:
+            data = _file.read(CHUNK_SIZE)
+            text = carry + decoder.decode(data, final=not data)
+            if not data:
+                if text:
+                    yield text
+                return
+            cut = text.rfind("\n") + 1
+            carry = text[cut:]
+            if cut:
+                yield text[:cut]
+
+
+def replace_lines(regex, replacement, text):
+    """
+    Replace the matches of regex in every line of text on its own, so the
+    result doesn't depend on where the file was cut into blocks. Returns
+    (new text, number of replacements).
+    """
+    lines = text.split("\n")
+    # Nothing comes after the last newline, that isn't a line.
+    end = len(lines) - 1 if text.endswith("\n") else len(lines)
+    count = 0
+    for i in range(end):
+        lines[i], replacements = regex.subn(replacement, lines[i])
+        count += replacements
+    return "\n".join(lines), count
+
+
+def get_output_format(file_format, operations):
+    """Return the FileFormat the file should be written in."""
+    encoding = file_format.encoding
+    newline = file_format.newline
+    bom = file_format.bom
+    for operation in operations:
+        if operation[0] == "encode":
+            if codecs.lookup(operation[1]).name != codecs.lookup(encoding).name:
+                # The old BOM doesn't belong to the new encoding.
+                bom = b''
+            encoding = operation[1]
+        elif operation[0] == "newline":
+            newline = NEWLINES[operation[1]]
+    return FileFormat(encoding, newline, bom)
+
+
+def process_file(path, operations, dry_run=False):
+    """Run the operations over the file at path and return a FileResult."""
+    try:
+        file_format = detect_file_format(path)
+    except BinaryFileError as e:
+        return FileResult(path, "skipped", message=str(e))
+    except (IOError, OSError) as e:
+        return FileResult(path, "error", message=str(e))
+
+    output_format = get_output_format(file_format, operations)
+    format_changed = (output_format.encoding, output_format.newline,
+                      output_format.bom) != \
+        (file_format.encoding, file_format.newline, file_format.bom)
+
+    # Compile the edits once for the whole file.
+    edits = []
+    for operation in operations:
+        if operation[0] == "replace":
+            regex = re.compile(operation[1])
+            edits.append(lambda text, regex=regex, repl=operation[2]:
+                         replace_lines(regex, repl, text))
+        elif operation[0] == "strip":
+            edits.append(lambda text:
+                         textops.TRAILING_WHITESPACE.subn("", text))
+        elif operation[0] == "case":
+            edits.append(lambda text, case=operation[1]:
+                         (textops.set_case(text, case), 0))
+
+    # [replacements, whether the text changed at all]
+    counts = [0, False]
+
+    def blocks():
+        for block in read_blocks(path, file_format):
+            new_block = block
+            for edit in edits:
+                new_block, replacements = edit(new_block)
+                counts[0] += replacements
+            if new_block != block:
+                counts[1] = True
+            yield new_block
+
+    try:
+        if dry_run:
+            # Still encode, so text the new encoding can't hold is reported.
+            for data in output_format.encode_chunks(blocks()):
+                pass
+        else:
+            save_chunks(output_format.encode_chunks(blocks()), path,
+                        should_replace=lambda: counts[1] or format_changed)
+    except (IOError, OSError, UnicodeError) as e:
+        return FileResult(path, "error", counts[0], str(e))
+
+    if counts[1] or format_changed:
+        return FileResult(path, "changed", counts[0],
+                          "dry run" if dry_run else "")
+    return FileResult(path, "unchanged")
+
+
+def run(paths, operations, jobs=None, dry_run=False):
+    """Process every path, yielding a FileResult for each in order."""
+    if jobs == 1 or len(paths) < 2:
+        for path in paths:
+            yield process_file(path, operations, dry_run)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for result in executor.map(process_file, paths,
+                                   itertools.repeat(operations),
+                                   itertools.repeat(dry_run),
+                                   chunksize=16):
+            yield result
+
+
+def main(argv):
+    """The entry point of umte --batch. Returns the exit status."""
+    parser = argparse.ArgumentParser(prog="umte --batch",
+            description="Apply a script of edits to many files.")
+    parser.add_argument("-e", "--expression", action="append", default=[],
+            help="an operation to run, can be given more than once")
+    parser.add_argument("-f", "--script",
+            help="a file with one operation per line")
+    parser.add_argument("-l", "--file-list",
+            help="a file with one path per line, - for stdin")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+            help="how many files to process at once")
+    parser.add_argument("-n", "--dry-run", action="store_true",
+            help="report what would change without writing anything")
+    parser.add_argument("files", nargs="*",
+            help="files or glob patterns, ** matches directories")
+    args = parser.parse_args(argv)
+
+    try:
+        operations = parse_script(args.expression)
+        if args.script is not None:
+            with open(args.script, 'r', encoding='utf-8') as _file:
+                operations += parse_script(_file)
+    except (IOError, ValueError, re.error, LookupError) as e:
+        print("umte: " + str(e), file=sys.stderr)
+        return 2
+    if not operations:
+        parser.error("no operations given, use -e or -f")
+
+    patterns = list(args.files)
+    if args.file_list is not None:
+        if args.file_list == "-":
+            patterns += [line.rstrip("\n") for line in sys.stdin if line.strip()]
+        else:
+            with open(args.file_list, 'r', encoding='utf-8') as _file:
+                patterns += [line.rstrip("\n") for line in _file if line.strip()]
+    paths = expand_paths(patterns)
+
+    totals = {"changed": 0, "unchanged": 0, "skipped": 0, "error": 0}
+    replacements = 0
+    print("{:<10} {:>8}  {}".format("status", "replaced", "file"))
+    for result in run(paths, operations, args.jobs, args.dry_run):
+        print(result)
+        totals[result.status] += 1
+        replacements += result.replacements
+
+    print("\n{} files: {changed} changed, {unchanged} unchanged, "
+          "{skipped} skipped, {error} failed, {} replacements".format(
+              len(paths), replacements, **totals))
+    return 1 if totals["error"] else 0
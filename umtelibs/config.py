@@ -23,16 +23,173 @@ Nearly everything related to configuration with umte is contained in here.
 
 config files will be stored in the user's ~/.config/ directory
 inside of the umte folder that will be created.
+
+Every setting is declared in SETTINGS with its type and default. The
+values are parsed once, when the file is read, and kept as attributes,
+config.files.large_file_size for example. A value that doesn't parse
+is warned about once and the default is used instead.
+
+Changes are written a moment after the last one, all together, to a
+temporary file that then replaces umte.conf, so a crash can't leave it
+half written. Only the lines of the values that changed are rewritten,
+the comments and everything else in the file are kept as they are. Edits made to umte.conf while umte is running are read
+back in, and whoever connected to the Config is told what changed.
 """
 
 import os
+import re
+import configparser
+from gi.repository import GLib, Gio
+from umtelibs.saver import save_chunks
 # The version of pyxdg in Fedora's repositories is out of date, so use a
 # more recent version that supports python3
 import xdg.BaseDirectory
 
-default_config = """[view]
-linenumbers = no
-"""
+class Setting(object):
+    """
+    One option in umte.conf: its section, name, type (bool, int or str)
+    and default. minimum, for ints, is the smallest value allowed.
+    """
+
+    def __init__(self, section, name, _type, default, comment=None,
+                 minimum=None):
+        self.section = section
+        self.name = name
+        self.type = _type
+        self.default = default
+        self.comment = comment
+        self.minimum = minimum
+
+    def parse(self, text):
+        """Return text as a value of this setting, raising ValueError if
+        it isn't one."""
+        if self.type is bool:
+            states = configparser.ConfigParser.BOOLEAN_STATES
+            if text.lower() not in states:
+                raise ValueError("expected yes or no")
+            return states[text.lower()]
+        value = self.type(text)
+        if self.minimum is not None and value < self.minimum:
+            raise ValueError("the smallest allowed is {}".format(self.minimum))
+        return value
+
+    def format(self, value):
+        """Return value the way it's written in umte.conf."""
+        if self.type is bool:
+            return "yes" if value else "no"
+        return str(value)
+
+
+# Every setting umte has.
+SETTINGS = [
+    Setting("view", "linenumbers", bool, False),
+
+    Setting("files", "large_file_size", int, 64, minimum=1, comment=
+            "Files bigger than this many megabytes are opened in the read-only\n"
+            "large file viewer instead of being loaded into the buffer."),
+    Setting("files", "highlight_size", int, 4, minimum=0, comment=
+            "Files bigger than this many megabytes are highlighted around what's\n"
+            "on screen first, then the rest a bit at a time."),
+    Setting("files", "offscreen_highlight_size", int, 32, minimum=0, comment=
+            "Files bigger than this many megabytes only have what's on screen\n"
+            "highlighted."),
+
+    Setting("terminal", "scrollback_lines", int, 10000, minimum=-1, comment=
+            "How many lines the terminal keeps, -1 for no limit."),
+    Setting("terminal", "spill_scrollback", bool, False, comment=
+            "yes to save the scrollback, compressed, to ~/.cache/umte/scrollback/\n"
+            "when the terminal is cleared and when umte quits."),
+]
+
+
+def make_default_config():
+    """Return the text of a umte.conf with every setting at its default."""
+    sections = []
+    for setting in SETTINGS:
+        if setting.section not in sections:
+            sections.append(setting.section)
+    text = []
+    for section in sections:
+        text.append("[{}]".format(section))
+        for setting in SETTINGS:
+            if setting.section != section:
+                continue
+            if setting.comment is not None:
+                text.extend("# " + line for line in setting.comment.split("\n"))
+            text.append("{} = {}".format(setting.name, setting.format(setting.default)))
+        text.append("")
+    return "\n".join(text)
+
+
+default_config = make_default_config()
+
+SECTION_LINE = re.compile(r"\s*\[([^\]]+)\]")
+VALUE_LINE = re.compile(r"([^\s=:#;][^=:]*?)\s*[=:]")
+
+
+def set_values(text, values):
+    """
+    Return the text of a conf file with values, which maps (section,
+    name) to the text of a value, put into it. The lines of those
+    options are replaced and the rest of text is left alone. Options
+    that aren't in it yet are added at the end of their section.
+    """
+    values = dict(values)
+    lines = text.split("\n")
+    if lines[-1] == "":
+        lines.pop()
+    output = []
+    section = None
+    # Where the last option of each section went in output.
+    section_ends = {}
+    in_value = False
+    for line in lines:
+        match = SECTION_LINE.match(line)
+        if match:
+            section = match.group(1).strip()
+            section_ends[section] = len(output) + 1
+            in_value = False
+            output.append(line)
+            continue
+        if in_value and line[:1].isspace() and line.strip():
+            # The rest of a value that went over more than one line.
+            continue
+        in_value = False
+        match = VALUE_LINE.match(line)
+        if match and section is not None:
+            key = (section, match.group(1).lower())
+            if key in values:
+                output.append("{} = {}".format(key[1], values.pop(key)))
+                in_value = True
+            else:
+                output.append(line)
+            section_ends[section] = len(output)
+            continue
+        output.append(line)
+
+    # Go backwards so adding lines doesn't move the ends still to come.
+    for (section, name), value in sorted(values.items(),
+            key=lambda item: -section_ends.get(item[0][0], len(output))):
+        line = "{} = {}".format(name, value)
+        if section in section_ends:
+            output.insert(section_ends[section], line)
+        else:
+            if output and output[-1].strip():
+                output.append("")
+            output.extend(["[{}]".format(section), line])
+            section_ends[section] = len(output)
+    return "\n".join(output) + "\n"
+
+
+class Section(object):
+    """The values of the settings in a section, as attributes."""
+
+    def __init__(self, name):
+        self.name = name
+
+
+# How long to wait after a change before writing, in milliseconds.
+WRITE_DELAY = 500
 
 
 class Config(object):
@@ -44,7 +201,12 @@ class Config(object):
 
     check_for_conf_file:
     Check if the config file (~/.config/umte/umte.conf) exists, create it if not.
-    
+
+    connect:
+    Call a function whenever a value changes.
+
+    The values themselves are attributes of a Section for each section,
+    like config.view.linenumbers.
     """
     
     def __init__(self, program_name):
@@ -57,44 +219,153 @@ class Config(object):
 
         self.check_for_conf_file()
 
-        # Load the parser and read the conf file
-        self.config = configparser.ConfigParser()
-        self.config.read(self.conf_file)
-        
+        # The raw values that have been warned about, so each bad value
+        # is only mentioned once.
+        self.warned = set()
+        for setting in SETTINGS:
+            if not hasattr(self, setting.section):
+                setattr(self, setting.section, Section(setting.section))
+        self.config = self.parse()
+        self.load_values()
+        self.listeners = []
+        self.write_id = None
+        # Maps (section, name) to the text of the values waiting to be
+        # written.
+        self.changes = {}
+        # What was last written to or read from the conf file, so umte
+        # doesn't reload its own writes.
+        self.written = self.get_text()
+
+        self.monitor = Gio.File.new_for_path(self.conf_file).monitor_file(
+            Gio.FileMonitorFlags.NONE, None)
+        self.monitor.connect("changed", self.on_file_changed)
+
     def check_for_conf_file(self):
         """Check if the conf_file exists, create a default conf_file if one doesn't exist"""
-        if os.path.exists(self.conf_file):
-            print("config file exists.")
-        else:
-            print("config file does not exist, creating default config file.")
+        if not os.path.exists(self.conf_file):
             try:
-                _file = open(self.conf_file, 'w', encoding='utf-8')
-                _file.write(default_config)
-                _file.close()
-                print("config file has been created")
-
-            except:
+                save_chunks([default_config.encode('utf-8')], self.conf_file)
+            except (IOError, OSError):
                 print("Unable to create config file, using default config")
-    
+
+    def parse(self):
+        """Return a parser with the defaults and then the conf file read in.
+        The defaults are read first so older conf files still have every
+        option."""
+        parser = configparser.ConfigParser()
+        parser.read_string(default_config)
+        try:
+            parser.read(self.conf_file, encoding='utf-8')
+        except configparser.Error as e:
+            print("Unable to read " + self.conf_file + ": " + str(e))
+        return parser
+
+    def get_setting(self, section, _property):
+        for setting in SETTINGS:
+            if setting.section == section and setting.name == _property:
+                return setting
+        raise KeyError("No setting {} in [{}]".format(_property, section))
+
+    def load_values(self):
+        """
+        Parse every setting in the parser into the Sections, and return
+        the settings whose value changed.
+        """
+        changed = []
+        for setting in SETTINGS:
+            text = self.config.get(setting.section, setting.name)
+            try:
+                value = setting.parse(text)
+            except ValueError as e:
+                key = (setting.section, setting.name, text)
+                if key not in self.warned:
+                    self.warned.add(key)
+                    print("Invalid value {!r} for {} in [{}] of {}: {}, using {}".format(
+                        text, setting.name, setting.section, self.conf_file,
+                        e, setting.format(setting.default)))
+                value = setting.default
+            section = getattr(self, setting.section)
+            if getattr(section, setting.name, None) != value:
+                setattr(section, setting.name, value)
+                changed.append(setting)
+        return changed
+
+    def get_text(self):
+        try:
+            with open(self.conf_file, 'r', encoding='utf-8') as _file:
+                return _file.read()
+        except (IOError, UnicodeDecodeError):
+            return None
+
+    def connect(self, callback):
+        """
+        Call callback(section, _property, value) whenever a value changes,
+        by write_config or by the conf file being edited. value is
+        already parsed.
+        """
+        self.listeners.append(callback)
+
+    def notify(self, section, _property, value):
+        for callback in self.listeners:
+            callback(section, _property, value)
+
     def read_config(self, section, _property):
-        """Read the _property's value in section and return it."""
-        return(self.config.get(section, _property))
-        print("Reading config")
+        """Return the parsed value of _property in section."""
+        return getattr(getattr(self, section), _property)
 
     def write_config(self, section, _property, value):
         """
-        Set _property's value to "value" in section and write changes 
-        to the conf file.
+        Set _property's value to "value" in section. The conf file is
+        written shortly after, along with any other changes made by then.
         """
-        #TODO Check for the conf_file and prompt a dialog if it doesn't exist
-        # to ask if they want to create a default config.
-        self.config.set(section, _property, value)
-        # Write the changes to the conf_file
-        _file = open(self.conf_file, 'w', encoding='utf-8')
-        self.config.write(_file)
-        _file.close()
-        print("Successfully wrote changes to config")
+        setting = self.get_setting(section, _property)
+        if getattr(getattr(self, section), _property) == value:
+            return
+        setattr(getattr(self, section), _property, value)
+        self.config.set(section, _property, setting.format(value))
+        self.changes[(section, _property)] = setting.format(value)
+        if self.write_id is not None:
+            GLib.source_remove(self.write_id)
+        self.write_id = GLib.timeout_add(WRITE_DELAY, self.flush)
+        self.notify(section, _property, value)
+
+    def flush(self):
+        """Write any changes that are waiting to the conf file now."""
+        if self.write_id is None:
+            return False
+        GLib.source_remove(self.write_id)
+        self.write_id = None
+        text = self.get_text()
+        if text is None:
+            text = default_config
+        text = set_values(text, self.changes)
+        self.changes = {}
+        try:
+            save_chunks([text.encode('utf-8')], self.conf_file)
+            self.written = text
+        except (IOError, OSError) as e:
+            print("Unable to write the config to " + self.conf_file + ": " + str(e))
+        return False
 
     def reload_config(self):
-        """Tell the parser to read the conf_file again."""
-        self.config.read(self.conf_file)
+        """Read the conf_file again, telling the listeners what changed."""
+        text = self.get_text()
+        if text is None or text == self.written:
+            return
+        self.written = text
+        self.config = self.parse()
+        for setting in self.load_values():
+            self.notify(setting.section, setting.name,
+                        getattr(getattr(self, setting.section), setting.name))
+
+    def on_file_changed(self, monitor, _file, other_file, event_type):
+        # Editors that save through a temporary file make it appear
+        # as created or moved in rather than changed.
+        if event_type in (Gio.FileMonitorEvent.CHANGES_DONE_HINT,
+                          Gio.FileMonitorEvent.CREATED,
+                          Gio.FileMonitorEvent.MOVED_IN,
+                          Gio.FileMonitorEvent.RENAMED):
+            if self.write_id is not None:
+                # umte's own changes win, they're written in a moment.
+                return
+            self.reload_config()
@@ -0,0 +1,294 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/document.py
+
+A piece table copy of the text in a buffer that doesn't need Gtk.
+
+The pieces are kept in a treap that is never changed in place: every
+edit copies the few nodes on its path and makes a new root. Holding on
+to an old root is a snapshot of the document that costs nothing to take
+and can be read from other threads while the buffer keeps changing.
+"""
+
+import random
+
+# Inserted text is cut into pieces no longer than this, so finding a
+# line inside a piece never has to look through much text.
+MAX_PIECE_LENGTH = 64 * 1024
+
+
+class Piece(object):
+    """
+    A node of the treap. Holds the text[start:start + length] piece of
+    an (immutable) string, plus the totals for the subtree below it.
+    """
+    __slots__ = ('text', 'start', 'length', 'newlines', 'priority',
+                 'left', 'right', 'total_length', 'total_newlines')
+
+    def __init__(self, text, start, length, newlines, priority,
+                 left=None, right=None):
+        self.text = text
+        self.start = start
+        self.length = length
+        self.newlines = newlines
+        self.priority = priority
+        self.left = left
+        self.right = right
+        self.total_length = length
+        self.total_newlines = newlines
+        if left is not None:
+            self.total_length += left.total_length
+            self.total_newlines += left.total_newlines
+        if right is not None:
+            self.total_length += right.total_length
+            self.total_newlines += right.total_newlines
+
+    def with_children(self, left, right):
+        """Return a copy of this node with different children."""
+        return Piece(self.text, self.start, self.length, self.newlines,
+                     self.priority, left, right)
+
+    def get_text(self):
+        return self.text[self.start:self.start + self.length]
+
+
+def new_piece(text, start, length):
+    return Piece(text, start, length,
+                 text.count("\n", start, start + length), random.random())
+
+
+def merge(left, right):
+    """Join two treaps, every piece of left coming before right."""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        return left.with_children(left.left, merge(left.right, right))
+    return right.with_children(merge(left, right.left), right.right)
+
+
+def split(node, offset):
+    """Split a treap into the text before offset and the text after it."""
+    if node is None:
+        return None, None
+
+    left_length = node.left.total_length if node.left is not None else 0
+    if offset <= left_length:
+        left, right = split(node.left, offset)
+        return left, node.with_children(right, node.right)
+
+    offset -= left_length
+    if offset >= node.length:
+        left, right = split(node.right, offset - node.length)
+        return node.with_children(node.left, left), right
+
+    # The split falls inside this piece, cut it in two.
+    head = new_piece(node.text, node.start, offset)
+    tail = new_piece(node.text, node.start + offset, node.length - offset)
+    return merge(node.left, head), merge(tail, node.right)
+
+
+def build(text):
+    """Build a treap holding text, cut into MAX_PIECE_LENGTH pieces."""
+    root = None
+    for start in range(0, len(text), MAX_PIECE_LENGTH):
+        length = min(MAX_PIECE_LENGTH, len(text) - start)
+        root = merge(root, new_piece(text, start, length))
+    return root
+
+
+class Snapshot(object):
+    """
+    A read-only view of the document at one point in time.
+
+    Snapshots never change, so they can be handed to worker threads.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def get_length(self):
+        """Return the number of characters in the document."""
+        return self.root.total_length if self.root is not None else 0
+
+    def get_line_count(self):
+        """Return the number of lines, like Gtk.TextBuffer.get_line_count."""
+        if self.root is None:
+            return 1
+        return self.root.total_newlines + 1
+
+    def offset_to_line(self, offset):
+        """Return the line that the character at offset is on."""
+        node = self.root
+        line = 0
+        while node is not None:
+            left = node.left
+            left_length = left.total_length if left is not None else 0
+            if offset < left_length:
+                node = left
+                continue
+            if left is not None:
+                line += left.total_newlines
+            offset -= left_length
+            if offset < node.length:
+                return line + node.text.count("\n", node.start,
+                                              node.start + offset)
+            line += node.newlines
+            offset -= node.length
+            node = node.right
+        return line
+
+    def line_to_offset(self, line):
+        """Return the offset of the first character of line."""
+        if line <= 0:
+            return 0
+        node = self.root
+        offset = 0
+        # Look for the newline that ends line - 1.
+        remaining = line
+        while node is not None:
+            left = node.left
+            left_newlines = left.total_newlines if left is not None else 0
+            if remaining <= left_newlines:
+                node = left
+                continue
+            if left is not None:
+                offset += left.total_length
+            remaining -= left_newlines
+            if remaining <= node.newlines:
+                pos = node.start - 1
+                for i in range(remaining):
+                    pos = node.text.find("\n", pos + 1)
+                return offset + pos - node.start + 1
+            remaining -= node.newlines
+            offset += node.length
+            node = node.right
+        # Past the last line.
+        return self.get_length()
+
+    def iter_pieces(self):
+        """Yield every piece in order, without recursion."""
+        stack = []
+        node = self.root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node
+            node = node.right
+
+    def iter_chunks(self, start=0, end=None, size=None):
+        """
+        Yield the text between start and end a piece at a time, or in
+        chunks of at most size characters if size is given.
+        """
+        if end is None:
+            end = self.get_length()
+        offset = 0
+        for piece in self.iter_pieces():
+            piece_end = offset + piece.length
+            if piece_end > start and offset < end:
+                begin = piece.start + max(0, start - offset)
+                stop = piece.start + min(piece.length, end - offset)
+                if size is None:
+                    yield piece.text[begin:stop]
+                else:
+                    for i in range(begin, stop, size):
+                        yield piece.text[i:min(i + size, stop)]
+            if piece_end >= end:
+                break
+            offset = piece_end
+
+    def get_text(self, start=0, end=None):
+        """Return the text between start and end as one string."""
+        return "".join(self.iter_chunks(start, end))
+
+    def iter_lines(self, start=0, end=None, size=None):
+        """
+        Yield (offset, text) for blocks of whole lines, so a regular
+        expression that doesn't match newlines never misses a match that
+        crosses two chunks. size is passed on to iter_chunks, blocks are
+        only longer than that when a line is.
+        """
+        carry = ""
+        carry_offset = start
+        for chunk in self.iter_chunks(start, end, size):
+            cut = chunk.rfind("\n") + 1
+            if cut == 0:
+                carry += chunk
+                continue
+            block = carry + chunk[:cut]
+            yield carry_offset, block
+            carry_offset += len(block)
+            carry = chunk[cut:]
+        if carry:
+            yield carry_offset, carry
+
+    def finditer(self, regex, start=0, end=None):
+        """
+        Yield (start, end) offsets of every match of the compiled regex.
+        Matches can't span more than one line.
+        """
+        for offset, block in self.iter_lines(start, end):
+            for match in regex.finditer(block):
+                if match.end() > match.start():
+                    yield offset + match.start(), offset + match.end()
+
+
+class Document(object):
+    """
+    Keeps a piece table in step with a Gtk.TextBuffer through its
+    insert-text and delete-range signals.
+    """
+
+    def __init__(self, text=""):
+        self.root = build(text)
+
+    def connect_buffer(self, buff):
+        """Mirror every change made to buff from now on."""
+        self.root = None
+        start, end = buff.get_bounds()
+        if not start.equal(end):
+            self.root = build(buff.get_text(start, end, False))
+        # The default handlers run last, so the iters still point at
+        # where the change is about to happen.
+        buff.connect("insert-text", self.on_insert_text)
+        buff.connect("delete-range", self.on_delete_range)
+
+    def insert(self, offset, text):
+        left, right = split(self.root, offset)
+        self.root = merge(merge(left, build(text)), right)
+
+    def delete(self, start, end):
+        left, rest = split(self.root, start)
+        middle, right = split(rest, end - start)
+        self.root = merge(left, right)
+
+    def snapshot(self):
+        """Return a Snapshot of the document as it is now."""
+        return Snapshot(self.root)
+
+    def on_insert_text(self, buff, location, text, length):
+        self.insert(location.get_offset(), text)
+
+    def on_delete_range(self, buff, start, end):
+        self.delete(start.get_offset(), end.get_offset())
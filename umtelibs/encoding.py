@@ -0,0 +1,213 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/encoding.py
+
+Figures out the encoding and line endings of a file from the first few
+kilobytes of it, and converts text to and from that format when loading
+and saving.
+"""
+
+import codecs
+import xdg.Mime
+
+# How many bytes from the start of a file are looked at.
+SNIFF_SIZE = 64 * 1024
+
+# Byte order marks, longest first so UTF-32 isn't mistaken for UTF-16.
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+
+# What's used when the text isn't valid UTF-8. Every byte is valid
+# latin-1, so files always load and save back unchanged.
+FALLBACK_ENCODING = 'latin-1'
+
+NEWLINE_NAMES = {"\n": "LF", "\r\n": "CRLF", "\r": "CR"}
+
+
+class BinaryFileError(Exception):
+    """Raised when a file doesn't look like text."""
+    pass
+
+
+class FileFormat(object):
+    """
+    The encoding, byte order mark and line ending style of a file.
+
+    Text in the buffer always uses "\\n" for line endings. It's converted
+    to and from the file's own style when loading and saving.
+    """
+
+    def __init__(self, encoding='utf-8', newline="\n", bom=b''):
+        self.encoding = encoding
+        self.newline = newline
+        self.bom = bom
+
+    def __repr__(self):
+        return "<FileFormat {} {}{}>".format(self.encoding,
+                NEWLINE_NAMES[self.newline], " BOM" if self.bom else "")
+
+    def get_decoder(self):
+        """Return a TextDecoder for reading a file in this format."""
+        return TextDecoder(self.encoding, self.newline)
+
+    def encode_chunks(self, chunks):
+        """Encode chunks of buffer text to bytes in this format."""
+        encoder = codecs.getincrementalencoder(self.encoding)()
+        if self.bom:
+            yield self.bom
+        for chunk in chunks:
+            if self.newline != "\n":
+                chunk = chunk.replace("\n", self.newline)
+            yield encoder.encode(chunk)
+        yield encoder.encode("", True)
+
+
+class TextDecoder(object):
+    """
+    Incrementally decode a file's bytes and convert its line endings to
+    "\\n", coping with characters and "\\r\\n" pairs split across chunks.
+    """
+
+    def __init__(self, encoding, newline):
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.newline = newline
+        self.pending_cr = False
+
+    def decode(self, data, final=False):
+        text = self.decoder.decode(data, final)
+        if self.newline == "\n":
+            return text
+
+        if self.pending_cr:
+            text = "\r" + text
+            self.pending_cr = False
+        if text.endswith("\r") and not final:
+            # The "\n" might be in the next chunk.
+            text = text[:-1]
+            self.pending_cr = True
+
+        if self.newline == "\r\n":
+            return text.replace("\r\n", "\n")
+        return text.replace("\r", "\n")
+
+
+def guess_utf16(data):
+    """
+    Guess if data is UTF-16 without a BOM from where its NUL bytes are.
+    Mostly-ASCII UTF-16 has a NUL in every other byte. Returns the codec
+    name or None.
+    """
+    if len(data) < 2:
+        return None
+    even_nuls = data[0::2].count(0)
+    odd_nuls = data[1::2].count(0)
+    half = len(data) // 2
+    if odd_nuls > half * 0.3 and even_nuls < half * 0.05:
+        return 'utf-16-le'
+    if even_nuls > half * 0.3 and odd_nuls < half * 0.05:
+        return 'utf-16-be'
+    return None
+
+
+def is_text_mime_type(data):
+    """
+    Ask the shared MIME database what data is. Returns False if it's
+    sure the data is something other than text, True otherwise.
+    """
+    try:
+        mime_type = xdg.Mime.get_type_by_data(data)
+    except Exception:
+        # A broken or unreadable magic database shouldn't stop a file
+        # from opening.
+        return True
+    if mime_type is None:
+        return True
+    return mime_type.media in ('text', 'inode') or \
+        mime_type.subtype in ('json', 'xml', 'javascript') or \
+        (mime_type.subtype.startswith('x-') and 'script' in mime_type.subtype)
+
+
+def detect_newline(text):
+    """Return the most common line ending in text, "\\n" if there are none."""
+    crlf = text.count("\r\n")
+    cr = text.count("\r") - crlf
+    lf = text.count("\n") - crlf
+    if crlf > lf and crlf >= cr:
+        return "\r\n"
+    if cr > lf:
+        return "\r"
+    return "\n"
+
+
+def detect_format(data, complete=False):
+    """
+    Work out the FileFormat of a file from data, the first bytes of it.
+    complete should be True if data is the whole file.
+
+    Raises BinaryFileError if the data doesn't look like text.
+    """
+    encoding = None
+    bom = b''
+    for mark, name in BOMS:
+        if data.startswith(mark):
+            encoding = name
+            bom = mark
+            break
+
+    if encoding is None and 0 in data:
+        encoding = guess_utf16(data)
+        if encoding is None:
+            # NULs in something that isn't UTF-16 or 32 means binary.
+            raise BinaryFileError("The file contains binary data")
+
+    body = data[len(bom):]
+    if encoding is None:
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        try:
+            # Don't fail on a character cut in half at the end of data.
+            decoder.decode(body, complete)
+            encoding = 'utf-8'
+        except UnicodeDecodeError:
+            # Not UTF-8, make sure it's not something like an image
+            # before falling back on latin-1.
+            if not is_text_mime_type(data):
+                raise BinaryFileError("The file does not look like text")
+            encoding = FALLBACK_ENCODING
+
+    text = codecs.getincrementaldecoder(encoding)('replace').decode(body)
+    return FileFormat(encoding, detect_newline(text), bom)
+
+
+def detect_file_format(file_path):
+    """
+    Read the start of file_path and return its FileFormat.
+
+    Only SNIFF_SIZE bytes are read. Raises BinaryFileError if the file
+    doesn't look like text and IOError if it can't be read.
+    """
+    with open(file_path, 'rb') as _file:
+        data = _file.read(SNIFF_SIZE)
+        complete = len(data) < SNIFF_SIZE
+    return detect_format(data, complete)
@@ -0,0 +1,109 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/events.py
+
+Tells the rest of umte when a document has changed, once per frame.
+
+A buffer emits "changed" for every edit, which is thousands of times
+for a big paste or a replace all. The bus collects them and, when the
+next frame is drawn, sends each listener one DocumentChanged for every
+tab that changed. How long each listener takes is kept so slow ones
+can be found.
+"""
+
+import time
+
+
+class DocumentChanged(object):
+    """Sent to listeners when tab's buffer has changed."""
+
+    def __init__(self, tab, changes):
+        self.tab = tab
+        # How many "changed" signals this event stands for.
+        self.changes = changes
+
+
+class Listener(object):
+    """A callback and how long it has taken so far."""
+
+    def __init__(self, name, callback):
+        self.name = name
+        self.callback = callback
+        self.calls = 0
+        self.total_time = 0.0
+        self.worst_time = 0.0
+
+    def __call__(self, event):
+        start = time.perf_counter()
+        self.callback(event)
+        elapsed = time.perf_counter() - start
+        self.calls += 1
+        self.total_time += elapsed
+        self.worst_time = max(self.worst_time, elapsed)
+
+
+class EventBus(object):
+    """
+    Sends DocumentChanged events to listeners, at most once per frame
+    of widget.
+    """
+
+    def __init__(self, widget):
+        self.widget = widget
+        self.listeners = []
+        # Maps tabs to the number of changes waiting to be sent.
+        self.pending = {}
+        self.tick_id = None
+
+    def connect(self, name, callback):
+        """Call callback(event) with every DocumentChanged event."""
+        self.listeners.append(Listener(name, callback))
+
+    def notify(self, tab):
+        """Note that tab has changed, to be sent with the next frame."""
+        self.pending[tab] = self.pending.get(tab, 0) + 1
+        if self.tick_id is None:
+            self.tick_id = self.widget.add_tick_callback(self.on_tick)
+
+    def flush(self):
+        """Send the changes waiting right now."""
+        if self.tick_id is not None:
+            self.widget.remove_tick_callback(self.tick_id)
+            self.tick_id = None
+        pending, self.pending = self.pending, {}
+        for tab, changes in pending.items():
+            event = DocumentChanged(tab, changes)
+            for listener in self.listeners:
+                listener(event)
+
+    def on_tick(self, widget, frame_clock):
+        self.tick_id = None
+        self.flush()
+        return False
+
+    def report(self):
+        """Print how long each listener has taken, slowest first."""
+        print("{:<20} {:>8} {:>12} {:>12}".format(
+            "listener", "calls", "total ms", "worst ms"))
+        for listener in sorted(self.listeners,
+                               key=lambda listener: -listener.total_time):
+            print("{:<20} {:>8} {:>12.2f} {:>12.2f}".format(
+                listener.name, listener.calls,
+                listener.total_time * 1000, listener.worst_time * 1000))
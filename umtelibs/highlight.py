@@ -0,0 +1,212 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/highlight.py
+
+Syntax highlighting for buffers too big to give to GtkSource whole.
+
+GtkSource works through a buffer from the top, so in a huge file the
+part on screen may not be highlighted for a long time, and it keeps the
+CPU busy until it reaches the end. Instead, the buffer is highlighted a
+block of lines at a time: each block is copied, with some lines before
+it for context, into a small scratch buffer, highlighted there, and the
+tags are copied back. The blocks on screen go first, then the others,
+nearest first, in idle time.
+"""
+
+import time
+from gi.repository import GtkSource, GLib
+from umtelibs.search import TIME_BUDGET
+
+# How many lines are highlighted together.
+BLOCK_LINES = 100
+
+# Lines before a block that are highlighted along with it, so a block
+# that starts inside a comment or a string usually comes out right.
+CONTEXT_LINES = 50
+
+# Blocks above and below the visible ones that count as visible.
+MARGIN_BLOCKS = 1
+
+# The tag properties copied from the scratch buffer.
+TAG_PROPERTIES = ("foreground-rgba", "background-rgba", "weight", "style",
+                  "underline", "strikethrough")
+
+
+class WindowHighlighter(object):
+    """
+    Highlights buff, shown in view, as language around what's visible.
+
+    If fill is False, blocks that aren't on screen are left alone, which
+    is for buffers so big that highlighting all of it isn't worth it.
+    """
+
+    def __init__(self, view, buff, language, fill=True):
+        self.view = view
+        self.buff = buff
+        self.fill = fill
+        self.scratch = GtkSource.Buffer()
+        self.scratch.set_max_undo_levels(0)
+        self.scratch.set_language(language)
+        self.scratch.set_style_scheme(buff.get_style_scheme())
+        # Maps the tags of the scratch buffer to the copies in buff.
+        self.tags = {}
+        # The blocks that have been highlighted.
+        self.done = set()
+        # Where to look for blocks that aren't done when filling, from
+        # the visible blocks up and down.
+        self.above = -1
+        self.below = 0
+        self.source_id = None
+
+        adjustment = view.get_vadjustment()
+        self.handler_ids = [
+            (buff, buff.connect_after("insert-text", self.on_insert_text)),
+            (buff, buff.connect_after("delete-range", self.on_delete_range)),
+            (adjustment, adjustment.connect("value-changed", self.on_scrolled)),
+        ]
+        self.on_scrolled(adjustment)
+
+    def stop(self):
+        """Stop highlighting and take off the highlighting done so far."""
+        if self.source_id is not None:
+            GLib.source_remove(self.source_id)
+            self.source_id = None
+        for widget, handler_id in self.handler_ids:
+            widget.disconnect(handler_id)
+        self.handler_ids = []
+        start, end = self.buff.get_bounds()
+        tag_table = self.buff.get_tag_table()
+        for tag in self.tags.values():
+            self.buff.remove_tag(tag, start, end)
+            tag_table.remove(tag)
+        self.tags = {}
+        self.done.clear()
+
+    def queue(self):
+        if self.source_id is None:
+            self.source_id = GLib.idle_add(self.step)
+
+    def get_block_count(self):
+        return (self.buff.get_line_count() + BLOCK_LINES - 1) // BLOCK_LINES
+
+    def get_visible_blocks(self):
+        rect = self.view.get_visible_rect()
+        first, line_top = self.view.get_line_at_y(rect.y)
+        last, line_top = self.view.get_line_at_y(rect.y + rect.height)
+        start = max(0, first.get_line() // BLOCK_LINES - MARGIN_BLOCKS)
+        end = min(self.get_block_count(),
+                  last.get_line() // BLOCK_LINES + MARGIN_BLOCKS + 1)
+        return range(start, end)
+
+    def next_block(self):
+        """Return the next block to highlight, or None if there isn't one."""
+        for block in self.get_visible_blocks():
+            if block not in self.done:
+                return block
+        if not self.fill:
+            return None
+        count = self.get_block_count()
+        while self.below < count or self.above >= 0:
+            if self.below < count:
+                self.below += 1
+                if self.below - 1 not in self.done:
+                    return self.below - 1
+            if self.above >= 0:
+                self.above -= 1
+                if self.above + 1 not in self.done:
+                    return self.above + 1
+        return None
+
+    def step(self):
+        deadline = time.monotonic() + TIME_BUDGET
+        while time.monotonic() < deadline:
+            block = self.next_block()
+            if block is None:
+                self.source_id = None
+                return False
+            self.highlight_block(block)
+        return True
+
+    def get_tag(self, scratch_tag):
+        """Return the tag in buff that looks like scratch_tag."""
+        tag = self.tags.get(scratch_tag)
+        if tag is None:
+            tag = self.buff.create_tag(None)
+            for name in TAG_PROPERTIES:
+                if scratch_tag.get_property(name.split("-")[0] + "-set"):
+                    tag.set_property(name, scratch_tag.get_property(name))
+            # Below everything else, like the search highlighting.
+            tag.set_priority(0)
+            self.tags[scratch_tag] = tag
+        return tag
+
+    def highlight_block(self, block):
+        buff = self.buff
+        first = block * BLOCK_LINES
+        last = first + BLOCK_LINES
+        start = buff.get_iter_at_line(first)
+        if last < buff.get_line_count():
+            end = buff.get_iter_at_line(last)
+        else:
+            end = buff.get_end_iter()
+        context = buff.get_iter_at_line(max(0, first - CONTEXT_LINES))
+        head = buff.get_text(context, start, True)
+
+        scratch = self.scratch
+        scratch.set_text(head + buff.get_text(start, end, True))
+        scratch_start, scratch_end = scratch.get_bounds()
+        scratch.ensure_highlight(scratch_start, scratch_end)
+
+        for tag in self.tags.values():
+            buff.remove_tag(tag, start, end)
+        offset = start.get_offset() - len(head)
+        position = scratch.get_iter_at_offset(len(head))
+        while not position.is_end():
+            next_position = position.copy()
+            next_position.forward_to_tag_toggle(None)
+            tags = position.get_tags()
+            if tags:
+                tag_start = buff.get_iter_at_offset(offset + position.get_offset())
+                tag_end = buff.get_iter_at_offset(offset + next_position.get_offset())
+                for tag in tags:
+                    buff.apply_tag(self.get_tag(tag), tag_start, tag_end)
+            position = next_position
+        self.done.add(block)
+
+    def invalidate(self, location, lines):
+        """Highlight the lines before location again."""
+        line = location.get_line()
+        for block in range((line - lines) // BLOCK_LINES, line // BLOCK_LINES + 1):
+            self.done.discard(block)
+        self.queue()
+
+    def on_insert_text(self, buff, location, text, length):
+        # location is at the end of the new text by now.
+        self.invalidate(location, text.count("\n"))
+
+    def on_delete_range(self, buff, start, end):
+        self.invalidate(start, 0)
+
+    def on_scrolled(self, adjustment):
+        # Fill outwards from wherever the view is now.
+        visible = self.get_visible_blocks()
+        self.above = visible.start - 1
+        self.below = visible.stop
+        self.queue()
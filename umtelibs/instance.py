@@ -0,0 +1,279 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/instance.py
+
+Keeps to one umte per user and display.
+
+The first umte listens on a Unix socket in $XDG_RUNTIME_DIR. Running
+umte again sends its files to that one over the socket and exits,
+without ever loading Gtk. A socket left behind by a umte that died is
+noticed when nothing answers on it, and removed.
+
+    umte file.txt +120:4 other.txt    opens other.txt at line 120, column 4
+    umte --new-instance file.txt      always starts a new umte
+
+The client half of this module only uses the standard library so it
+can run before gi is imported; GLib is imported by Server when needed.
+"""
+
+import os
+import re
+import json
+import stat
+import errno
+import socket
+import tempfile
+
+NEW_INSTANCE = "--new-instance"
+
+# How long to wait for the running umte to answer, in seconds.
+TIMEOUT = 2.0
+
+# Messages bigger than this many bytes are dropped.
+MAX_MESSAGE = 1024 * 1024
+
+POSITION = re.compile(r"\+(\d+)(?::(\d+))?$")
+
+
+def get_runtime_dir():
+    """
+    Return $XDG_RUNTIME_DIR, or a private directory in /tmp if it isn't
+    set. Returns None if that directory isn't safe to use.
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return runtime_dir
+    runtime_dir = os.path.join(tempfile.gettempdir(),
+                               "umte-{}".format(os.getuid()))
+    try:
+        os.mkdir(runtime_dir, 0o700)
+    except FileExistsError:
+        pass
+    except OSError:
+        return None
+    st = os.lstat(runtime_dir)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or \
+            st.st_mode & 0o077:
+        # Someone else made it, don't trust it.
+        return None
+    return runtime_dir
+
+
+def get_socket_path():
+    """
+    Return the path of the socket for this user and display, or None
+    if there's nowhere safe to put it.
+    """
+    runtime_dir = get_runtime_dir()
+    if runtime_dir is None:
+        return None
+    display = os.environ.get("WAYLAND_DISPLAY") or \
+        os.environ.get("DISPLAY") or ""
+    display = re.sub(r"[^A-Za-z0-9_.-]", "_", display)
+    return os.path.join(runtime_dir, "umte-{}.sock".format(display))
+
+
+def parse_file_args(args):
+    """
+    Return (path, line, column) for each file in args. A "+LINE[:COLUMN]"
+    before a file puts the cursor there, otherwise line and column are
+    None. Lines and columns count from 1.
+    """
+    files = []
+    line = column = None
+    for arg in args:
+        match = POSITION.match(arg)
+        if match is not None:
+            line = int(match.group(1))
+            column = int(match.group(2)) if match.group(2) else None
+            continue
+        files.append((os.path.abspath(arg), line, column))
+        line = column = None
+    return files
+
+
+def remove_stale_socket(path):
+    """Remove the socket at path, which nothing is listening on."""
+    try:
+        if stat.S_ISSOCK(os.lstat(path).st_mode):
+            os.unlink(path)
+    except OSError:
+        pass
+
+
+def forward(files):
+    """
+    Send files to the running umte. Returns True if it took them, False
+    if there isn't one and this process should carry on starting up.
+    """
+    path = get_socket_path()
+    if path is None:
+        return False
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(TIMEOUT)
+    try:
+        sock.connect(path)
+    except ConnectionRefusedError:
+        # Left behind by a umte that didn't get to clean up.
+        sock.close()
+        remove_stale_socket(path)
+        return False
+    except OSError:
+        sock.close()
+        return False
+
+    try:
+        message = json.dumps({"files": files}).encode('utf-8') + b"\n"
+        sock.sendall(message)
+        reply = sock.recv(16)
+    except OSError:
+        # Hung or gone, so start a new umte rather than wait on it.
+        return False
+    finally:
+        sock.close()
+    return reply.startswith(b"ok")
+
+
+def forward_args(argv):
+    """
+    Hand the files in argv to the running umte if there is one. Returns
+    True if they were, meaning this process is done. --new-instance is
+    removed from argv.
+    """
+    if NEW_INSTANCE in argv:
+        argv.remove(NEW_INSTANCE)
+        return False
+    if any(arg.startswith("--") for arg in argv[1:]):
+        # Other options, like --profile-startup, are for a new umte.
+        return False
+    return forward(parse_file_args(argv[1:]))
+
+
+def is_listening(path):
+    """Return True if a umte is answering on the socket at path."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+class Server(object):
+    """
+    Listens for other umtes. on_open(files) is called with the list of
+    (path, line, column) each one sends.
+    """
+
+    def __init__(self, on_open):
+        self.on_open = on_open
+        self.path = get_socket_path()
+        self.sock = None
+        self.watch_id = None
+        # Maps the file descriptors of connected clients to their socket
+        # and what they've sent so far.
+        self.clients = {}
+
+    def start(self):
+        """Start listening. Returns False if another umte already is."""
+        from gi.repository import GLib
+        if self.path is None:
+            return False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(self.path)
+        except OSError as e:
+            if e.errno != errno.EADDRINUSE or is_listening(self.path):
+                sock.close()
+                return False
+            remove_stale_socket(self.path)
+            try:
+                sock.bind(self.path)
+            except OSError:
+                sock.close()
+                return False
+        os.chmod(self.path, 0o600)
+        sock.listen(8)
+        sock.setblocking(False)
+        self.sock = sock
+        self.watch_id = GLib.io_add_watch(sock.fileno(), GLib.PRIORITY_DEFAULT,
+                                          GLib.IO_IN, self.on_connection)
+        return True
+
+    def close(self):
+        """Stop listening and remove the socket."""
+        from gi.repository import GLib
+        if self.sock is None:
+            return
+        GLib.source_remove(self.watch_id)
+        self.sock.close()
+        self.sock = None
+        for client, data in self.clients.values():
+            client.close()
+        self.clients = {}
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def on_connection(self, fd, condition):
+        from gi.repository import GLib
+        try:
+            client, address = self.sock.accept()
+        except OSError:
+            return True
+        client.setblocking(False)
+        self.clients[client.fileno()] = (client, bytearray())
+        GLib.io_add_watch(client.fileno(), GLib.PRIORITY_DEFAULT,
+                          GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR,
+                          self.on_client_data)
+        return True
+
+    def on_client_data(self, fd, condition):
+        client, data = self.clients[fd]
+        try:
+            chunk = client.recv(65536)
+        except BlockingIOError:
+            return True
+        except OSError:
+            chunk = b""
+        data += chunk
+        if chunk and b"\n" not in data and len(data) < MAX_MESSAGE:
+            return True
+
+        del self.clients[fd]
+        files = None
+        if b"\n" in data:
+            try:
+                message = json.loads(data[:data.index(b"\n")].decode('utf-8'))
+                files = [(path, line, column)
+                         for path, line, column in message["files"]]
+            except (ValueError, KeyError, TypeError):
+                files = None
+        try:
+            client.sendall(b"ok\n" if files is not None else b"error\n")
+        except OSError:
+            pass
+        client.close()
+        if files is not None:
+            self.on_open(files)
+        return False
@@ -0,0 +1,408 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/journal.py
+
+A crash recovery journal for the documents umte has open.
+
+Every edit made to a buffer is appended to a log in ~/.cache/umte/journal/
+as it happens, so a keystroke only costs writing that keystroke. The log
+starts from a base, either the file as it was loaded or saved, or a
+snapshot of the text. Once a log gets big it's compacted: a snapshot of
+the document is written out in the background and a new log is started
+from it.
+
+If umte crashes, the journals it leaves behind are replayed on the next
+launch to get the unsaved text back.
+
+Each journal is made of:
+    <id>.meta       which generation is current, and what its base is
+    <id>.<gen>.snap the base text of a generation, if it's a snapshot
+    <id>.<gen>.log  the edits made since the base
+"""
+
+import os
+import json
+import threading
+import xdg.BaseDirectory
+from gi.repository import GLib
+from umtelibs.document import Document
+from umtelibs.encoding import FileFormat
+from umtelibs.saver import save_chunks
+
+# Logs bigger than this many bytes get compacted.
+COMPACT_SIZE = 1024 * 1024
+
+_next_id = 0
+
+
+def get_journal_dir(program_name):
+    return xdg.BaseDirectory.save_cache_path(program_name, "journal")
+
+
+def new_journal_id():
+    """Return an id that's unique among the journals of running umtes."""
+    global _next_id
+    _next_id += 1
+    return "{}-{}".format(os.getpid(), _next_id)
+
+
+def file_stat(file_path):
+    st = os.stat(file_path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def format_to_list(file_format):
+    return [file_format.encoding, file_format.newline, file_format.bom.hex()]
+
+
+def format_from_list(values):
+    encoding, newline, bom = values
+    return FileFormat(encoding, newline, bytes.fromhex(bom))
+
+
+class Journal(object):
+    """
+    Journals the edits made to one buffer.
+
+    The document is the umtelibs.document.Document mirroring the buffer,
+    used to take snapshots when compacting.
+    """
+
+    def __init__(self, program_name, buff, document):
+        self.directory = get_journal_dir(program_name)
+        self.journal_id = new_journal_id()
+        self.buff = buff
+        self.document = document
+        self.generation = 0
+        self.path = None
+        self.file_format = FileFormat()
+        # The logs edits are written to. There are two while compacting,
+        # the old one is kept up to date until the new one takes over.
+        self.logs = []
+        self.compacting = False
+        # Set once the journal's files are removed, so a snapshot still
+        # being written doesn't bring one back.
+        self.discarded = False
+        self.handler_ids = []
+
+    def get_file(self, generation, kind):
+        return os.path.join(self.directory,
+                            "{}.{}.{}".format(self.journal_id, generation, kind))
+
+    def get_meta_file(self):
+        return os.path.join(self.directory, self.journal_id + ".meta")
+
+    def start(self, path=None, file_format=None, loaded=True):
+        """
+        Start journaling the buffer. path is the file it was loaded from,
+        which is used as the base if loaded is True, meaning the buffer
+        holds exactly what's in the file.
+        """
+        self.path = path
+        if file_format is not None:
+            self.file_format = file_format
+
+        self.handler_ids = [
+            self.buff.connect("insert-text", self.on_insert_text),
+            self.buff.connect("delete-range", self.on_delete_range),
+        ]
+        if path is not None and loaded:
+            self.reset_to_file()
+        elif self.document.snapshot().get_length() == 0:
+            # Nothing to snapshot for a new, empty document.
+            self.new_generation()
+            self.write_meta({"base": "empty"})
+        else:
+            self.new_generation()
+            self.compact()
+
+    def reset_to_file(self):
+        """
+        Start over from the file at self.path, after the buffer was saved
+        to it or loaded from it.
+        """
+        self.new_generation()
+        try:
+            stat = file_stat(self.path)
+        except OSError:
+            self.compact()
+            return
+        self.write_meta({"base": "file", "stat": stat})
+        self.close_logs(1)
+        self.remove_generations(self.generation)
+
+    def new_generation(self):
+        """Start a new log. Edits go to it and to the ones already open."""
+        self.generation += 1
+        log = open(self.get_file(self.generation, "log"), 'ab', buffering=0)
+        self.logs.append(log)
+
+    def close_logs(self, keep):
+        """Close all but the last keep logs."""
+        while len(self.logs) > keep:
+            self.logs.pop(0).close()
+
+    def write_meta(self, base):
+        meta = {
+            "pid": os.getpid(),
+            "path": self.path,
+            "format": format_to_list(self.file_format),
+            "generation": self.generation,
+        }
+        meta.update(base)
+        save_chunks([json.dumps(meta).encode('utf-8')], self.get_meta_file())
+
+    def remove_generations(self, end):
+        """Remove the files of every generation before end."""
+        for generation in range(1, end):
+            for kind in ("log", "snap"):
+                try:
+                    os.unlink(self.get_file(generation, kind))
+                except OSError:
+                    pass
+
+    def append(self, record):
+        for log in self.logs:
+            log.write(record)
+        if not self.compacting and self.logs[-1].tell() > COMPACT_SIZE:
+            self.compact()
+
+    def on_insert_text(self, buff, location, text, length):
+        data = text.encode('utf-8')
+        self.append(b"I%d %d\n" % (location.get_offset(), len(data)) +
+                    data + b"\n")
+
+    def on_delete_range(self, buff, start, end):
+        self.append(b"D%d %d\n" % (start.get_offset(), end.get_offset()))
+
+    def compact(self):
+        """
+        Write a snapshot of the document in the background and start a
+        new log from it.
+
+        Until the snapshot is on disk, edits go to both the old and the
+        new log, so a crash in the middle still has everything.
+        """
+        if self.compacting:
+            return
+        self.compacting = True
+        if len(self.logs) == 0 or self.logs[-1].tell() > 0:
+            self.new_generation()
+        generation = self.generation
+        snapshot = self.document.snapshot()
+
+        thread = threading.Thread(target=self._write_snapshot,
+                                  args=(generation, snapshot))
+        thread.daemon = True
+        thread.start()
+
+    def _write_snapshot(self, generation, snapshot):
+        if self.discarded:
+            GLib.idle_add(self._compacted, generation, False)
+            return
+        chunks = (chunk.encode('utf-8') for chunk in snapshot.iter_chunks())
+        try:
+            save_chunks(chunks, self.get_file(generation, "snap"))
+        except (IOError, OSError):
+            GLib.idle_add(self._compacted, generation, False)
+            return
+        GLib.idle_add(self._compacted, generation, True)
+
+    def _compacted(self, generation, success):
+        self.compacting = False
+        if not success:
+            return False
+        if self.discarded or generation != self.generation:
+            # Saved or discarded in the mean time, after its generation's
+            # files were removed.
+            try:
+                os.unlink(self.get_file(generation, "snap"))
+            except OSError:
+                pass
+            return False
+        self.write_meta({"base": "snapshot"})
+        self.close_logs(1)
+        self.remove_generations(generation)
+        return False
+
+    def discard(self):
+        """Stop journaling and remove the journal's files."""
+        for handler_id in self.handler_ids:
+            self.buff.disconnect(handler_id)
+        self.handler_ids = []
+        self.discarded = True
+        self.close_logs(0)
+        self.remove_generations(self.generation + 1)
+        try:
+            os.unlink(self.get_meta_file())
+        except OSError:
+            pass
+
+
+def is_running(pid):
+    """Return True if a process with pid is running."""
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def get_prefix(meta_file):
+    """Return the path of meta_file without ".meta", which its other files
+    start with."""
+    return meta_file[:-len(".meta")]
+
+
+def has_unsaved_edits(meta_file, meta):
+    """
+    Return True if the journal holds text that isn't in a file. One
+    based on an empty document or on a file, with nothing in its log,
+    was only ever looked at.
+    """
+    if meta.get("base") not in ("empty", "file"):
+        return True
+    log_file = "{}.{}.log".format(get_prefix(meta_file), meta.get("generation"))
+    try:
+        return os.path.getsize(log_file) > 0
+    except OSError:
+        return False
+
+
+def remove_strays(directory, names):
+    """
+    Remove the files of journals that have no meta file and whose umte
+    isn't running, like a snapshot that was still being written when its
+    journal was discarded and umte quit.
+    """
+    for name in names:
+        journal_id = name.split(".", 1)[0]
+        if journal_id + ".meta" in names:
+            continue
+        try:
+            pid = int(journal_id.split("-", 1)[0])
+        except ValueError:
+            continue
+        if not is_running(pid):
+            try:
+                os.unlink(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def find_orphans(program_name):
+    """
+    Return the meta files of journals left behind by umtes that are no
+    longer running. Orphans without unsaved edits are removed instead.
+    """
+    directory = get_journal_dir(program_name)
+    orphans = []
+    names = os.listdir(directory)
+    remove_strays(directory, names)
+    for name in names:
+        if not name.endswith(".meta"):
+            continue
+        meta_file = os.path.join(directory, name)
+        try:
+            with open(meta_file, 'r', encoding='utf-8') as _file:
+                meta = json.load(_file)
+        except (IOError, ValueError):
+            continue
+        if is_running(meta.get("pid", 0)):
+            continue
+        if has_unsaved_edits(meta_file, meta):
+            orphans.append(meta_file)
+        else:
+            remove_orphan(meta_file)
+    return orphans
+
+
+def read_log(log_file, document):
+    """Apply the edits in log_file to document. A torn last record is ignored."""
+    try:
+        _file = open(log_file, 'rb')
+    except IOError:
+        return
+    with _file:
+        while True:
+            header = _file.readline()
+            if not header.endswith(b"\n"):
+                break
+            try:
+                first, second = (int(n) for n in header[1:].split())
+            except ValueError:
+                break
+            if header.startswith(b"I"):
+                data = _file.read(second + 1)
+                if len(data) != second + 1:
+                    break
+                document.insert(first, data[:-1].decode('utf-8'))
+            elif header.startswith(b"D"):
+                document.delete(first, second)
+            else:
+                break
+
+
+def recover(meta_file):
+    """
+    Replay an orphaned journal. Returns (path, file_format, text), path
+    being the file the text belongs to or None if it was never saved.
+
+    Raises IOError or ValueError if the journal can't be replayed.
+    """
+    with open(meta_file, 'r', encoding='utf-8') as _file:
+        meta = json.load(_file)
+    prefix = get_prefix(meta_file)
+    generation = meta["generation"]
+    file_format = format_from_list(meta["format"])
+
+    if meta["base"] == "file":
+        if file_stat(meta["path"]) != meta["stat"]:
+            raise ValueError(meta["path"] + " was changed after the journal started")
+        decoder = file_format.get_decoder()
+        with open(meta["path"], 'rb') as _file:
+            data = _file.read()
+        text = decoder.decode(data[len(file_format.bom):], True)
+    elif meta["base"] == "empty":
+        text = ""
+    else:
+        with open("{}.{}.snap".format(prefix, generation), 'r',
+                  encoding='utf-8', newline='') as _file:
+            text = _file.read()
+
+    document = Document(text)
+    read_log("{}.{}.log".format(prefix, generation), document)
+    return meta["path"], file_format, document.snapshot().get_text()
+
+
+def remove_orphan(meta_file):
+    """Remove all the files of an orphaned journal."""
+    prefix = os.path.basename(meta_file)[:-len(".meta")]
+    directory = os.path.dirname(meta_file)
+    for name in os.listdir(directory):
+        if name.startswith(prefix + "."):
+            try:
+                os.unlink(os.path.join(directory, name))
+            except OSError:
+                pass
@@ -0,0 +1,181 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/languages.py
+
+Works out which language to highlight a file as, and remembers it.
+
+The language picked for each file, and the language each extension or
+filename turned out to be, are kept in ~/.cache/umte/languages.json so
+the next open is a dictionary lookup. Only files whose name says
+nothing get sniffed through the shared MIME database.
+
+An extension is only remembered when the language claims every file
+with it (a "*.ext" glob), since some languages go by the whole name:
+CMakeLists.txt is CMake, but notes.txt isn't.
+"""
+
+import os
+import json
+import xdg.BaseDirectory
+import xdg.Mime
+from umtelibs.encoding import SNIFF_SIZE
+from umtelibs.saver import save_chunks
+
+# Bump this if the format of the cache file changes.
+CACHE_VERSION = 2
+
+# How many files, and how many filenames, to remember the language of.
+# The ones used longest ago are forgotten first.
+MAX_PATHS = 2000
+MAX_NAMES = 2000
+
+
+def get_extension_key(path):
+    """Return the extension of path as it's kept in the cache, like
+    "*.py", or None if it doesn't have one (Makefile, .bashrc)."""
+    extension = os.path.splitext(os.path.basename(path))[1]
+    return "*" + extension.lower() if extension else None
+
+
+def claims_extension(language, key):
+    """Return True if language is used for every file ending in key."""
+    return any(glob.lower() == key for glob in language.get_globs() or [])
+
+
+def remember_recent(cache, key, value, limit):
+    """Set cache[key] to value as the most recently used, forgetting the
+    oldest entries past limit."""
+    cache.pop(key, None)
+    cache[key] = value
+    while len(cache) > limit:
+        del cache[next(iter(cache))]
+
+
+def sniff_mime_type(path):
+    """Return the mime type of the start of the file at path, or None."""
+    try:
+        with open(path, 'rb') as _file:
+            data = _file.read(SNIFF_SIZE)
+        mime_type = xdg.Mime.get_type_by_data(data)
+    except Exception:
+        return None
+    if mime_type is None:
+        return None
+    return str(mime_type)
+
+
+class LanguageResolver(object):
+    """
+    Finds the GtkSource language of files, caching the answers.
+
+    lang_manager is the GtkSource.LanguageManager to ask when the cache
+    doesn't know.
+    """
+
+    def __init__(self, program_name, lang_manager):
+        self.lang_manager = lang_manager
+        self.cache_file = os.path.join(
+            xdg.BaseDirectory.save_cache_path(program_name), "languages.json")
+        # Maps extensions ("*.py") and whole filenames to a language id,
+        # "" for none.
+        self.names = {}
+        # Maps real paths to the language id the file was last shown in.
+        self.paths = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as _file:
+                data = json.load(_file)
+            if data.get("version") != CACHE_VERSION:
+                return
+            self.names = dict(data["names"])
+            self.paths = dict(data["paths"])
+        except (IOError, ValueError, KeyError, TypeError):
+            self.names = {}
+            self.paths = {}
+
+    def save(self):
+        """Write the cache, if anything has changed."""
+        if not self.dirty:
+            return
+        data = json.dumps({
+            "version": CACHE_VERSION,
+            "names": self.names,
+            "paths": self.paths,
+        }, separators=(',', ':'))
+        try:
+            save_chunks([data.encode('utf-8')], self.cache_file)
+            self.dirty = False
+        except (IOError, OSError):
+            print("Unable to save the language cache to " + self.cache_file)
+
+    def get_language_id(self, path):
+        """Return the id of the language to highlight path as, or None."""
+        real_path = os.path.realpath(path)
+        if real_path in self.paths:
+            language_id = self.paths.pop(real_path)
+            # Move it to the end, it's the most recently used now.
+            self.paths[real_path] = language_id
+            return language_id or None
+
+        name = os.path.basename(path)
+        extension = get_extension_key(path)
+        if name in self.names:
+            language_id = self.names[name]
+        elif extension is not None and extension in self.names:
+            language_id = self.names[extension]
+        else:
+            language = self.lang_manager.guess_language(path, None)
+            language_id = language.get_id() if language is not None else ""
+            if language is not None and extension is not None and \
+                    claims_extension(language, extension):
+                self.names[extension] = language_id
+            else:
+                # Only true of this name, like CMakeLists.txt, or nothing
+                # was found, which says nothing about other files with
+                # the same extension.
+                remember_recent(self.names, name, language_id, MAX_NAMES)
+            self.dirty = True
+        if language_id:
+            return language_id
+
+        # Nothing in the name to go on, look at what's in the file.
+        mime_type = sniff_mime_type(path)
+        if mime_type is not None:
+            language = self.lang_manager.guess_language(None, mime_type)
+            if language is not None:
+                self.remember(path, language.get_id())
+                return language.get_id()
+        return None
+
+    def get_language(self, path):
+        """Return the GtkSource.Language to highlight path as, or None."""
+        language_id = self.get_language_id(path)
+        if language_id is None:
+            return None
+        return self.lang_manager.get_language(language_id)
+
+    def remember(self, path, language_id):
+        """Use language_id for path from now on."""
+        remember_recent(self.paths, os.path.realpath(path), language_id or "",
+                        MAX_PATHS)
+        self.dirty = True
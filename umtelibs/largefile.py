@@ -0,0 +1,316 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/largefile.py
+
+A read-only viewer for files that are too big to load into a buffer.
+
+The file is mmap'd and only the lines that are on screen are ever
+decoded and put into the view, so opening a 10 GB file costs about the
+same as opening a 10 MB one.
+
+Lines are found by searching the raw bytes for the file's newline, as
+encoded in the file's encoding, so UTF-16 and UTF-32 files page in as
+well as UTF-8 ones do.
+"""
+
+import mmap
+import bisect
+import threading
+from array import array
+from gi.repository import Gtk, GtkSource, Gdk, GLib
+from umtelibs.encoding import FileFormat
+
+# The line index stores how many lines come before every block of
+# BLOCK_SIZE bytes instead of every line's offset, so it stays tiny
+# (about 320 KB for a 10 GB file).
+BLOCK_SIZE = 256 * 1024
+# Lines longer than this are cut off in the view.
+MAX_LINE_LENGTH = 10000
+
+
+def get_array_type(size):
+    """Return the array typecode for unsigned ints of size bytes."""
+    for typecode in ('B', 'H', 'I', 'L'):
+        if array(typecode).itemsize == size:
+            return typecode
+    raise ValueError("No array type is {} bytes".format(size))
+
+
+class LineIndex(object):
+    """
+    A sparse index of the lines of a mmap'd file.
+
+    The index is built in a background thread. Until it's done, only the
+    lines in the part of the file that has been indexed can be looked up.
+
+    file_format is the umtelibs.encoding.FileFormat of the file. Lines
+    are split on "\n", or on "\r" in files that only use that.
+    """
+
+    def __init__(self, path, file_format=None):
+        self.path = path
+        if file_format is None:
+            file_format = FileFormat()
+        self.encoding = file_format.encoding
+        self.strip_cr = file_format.newline == "\r\n"
+        newline = "\r" if file_format.newline == "\r" else "\n"
+        self.newline = newline.encode(self.encoding)
+        # How many bytes each character takes in UTF-16 and UTF-32.
+        # Newlines are only looked for on those boundaries.
+        self.unit = len(self.newline)
+        if self.unit > 1:
+            self.newline_array = array(get_array_type(self.unit), self.newline)
+        # Lines start after the byte order mark.
+        self.start = len(file_format.bom)
+        self._file = open(path, 'rb')
+        self.size = self.get_size()
+        if self.size > 0:
+            self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            # mmap can't map empty files.
+            self.mm = b''
+
+        # block_lines[b] is the number of newlines before block b.
+        self.block_lines = array('Q', [0])
+        self.indexed_size = 0
+        self.complete = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get_size(self):
+        self._file.seek(0, 2)
+        return self._file.tell()
+
+    def build(self, on_progress=None):
+        """
+        Start indexing the file in a background thread. on_progress() is
+        called from the main loop every so often while indexing.
+        """
+        self._thread = threading.Thread(target=self._index,
+                                        args=(on_progress,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def count_newlines(self, data):
+        """Return how many newlines are in data, which starts on a
+        character boundary."""
+        if self.unit == 1:
+            return data.count(self.newline)
+        # A plain count could match the end of one character and the
+        # start of the next, so the data is counted in whole characters.
+        characters = array(self.newline_array.typecode,
+                           data[:len(data) - len(data) % self.unit])
+        return characters.count(self.newline_array[0])
+
+    def find_newline(self, start, end=None):
+        """
+        Return the offset of the first newline between start and end,
+        which is on a character boundary, or -1 if there isn't one.
+        """
+        if end is None:
+            end = self.size
+        pos = self.mm.find(self.newline, start, end)
+        while pos >= 0 and (pos - self.start) % self.unit != 0:
+            pos = self.mm.find(self.newline, pos + 1, end)
+        return pos
+
+    def _index(self, on_progress):
+        lines = 0
+        pos = self.start
+        blocks = 0
+        while pos < self.size and not self._stop.is_set():
+            end = min(pos + BLOCK_SIZE, self.size)
+            lines += self.count_newlines(self.mm[pos:end])
+            self.block_lines.append(lines)
+            pos = end
+            self.indexed_size = pos
+            blocks += 1
+            # Tell the main loop about every 64 MB or so.
+            if on_progress is not None and blocks % 256 == 0:
+                GLib.idle_add(on_progress)
+
+        self.complete = not self._stop.is_set()
+        if on_progress is not None:
+            GLib.idle_add(on_progress)
+
+    def get_line_count(self):
+        """Return the number of lines indexed so far."""
+        count = self.block_lines[-1]
+        if self.complete and (self.size <= self.start or
+                              self.mm[-self.unit:] != self.newline):
+            # The last line doesn't end in a newline.
+            count += 1
+        return count
+
+    def estimate_line_count(self):
+        """Guess the total number of lines while the index is being built."""
+        if self.complete or self.indexed_size == 0:
+            return max(1, self.get_line_count())
+        return int(self.block_lines[-1] * self.size / self.indexed_size)
+
+    def line_offset(self, line):
+        """
+        Return the byte offset where line starts, or None if that part of
+        the file hasn't been indexed yet.
+        """
+        if line <= 0:
+            return self.start
+        # Find the block holding the newline that ends line - 1.
+        block_lines = self.block_lines
+        block = bisect.bisect_left(block_lines, line, 0, len(block_lines)) - 1
+        if block + 1 >= len(block_lines):
+            return None
+
+        pos = self.start + block * BLOCK_SIZE
+        for i in range(line - block_lines[block]):
+            pos = self.find_newline(pos) + self.unit
+        return pos
+
+    def get_lines(self, first, count):
+        """Return up to count lines starting at line first, decoded."""
+        pos = self.line_offset(first)
+        if pos is None:
+            return []
+
+        lines = []
+        while len(lines) < count and pos < self.size:
+            end = self.find_newline(pos, pos + MAX_LINE_LENGTH * 4)
+            if end < 0:
+                # Either the last line or one that's too long to show.
+                end = min(self.size, pos + MAX_LINE_LENGTH * 4)
+                next_pos = self.find_newline(end)
+                next_pos = self.size if next_pos < 0 else next_pos + self.unit
+            else:
+                next_pos = end + self.unit
+            line = self.mm[pos:end].decode(self.encoding, 'replace')
+            if self.strip_cr and line.endswith("\r"):
+                line = line[:-1]
+            lines.append(line[:MAX_LINE_LENGTH])
+            pos = next_pos
+        return lines
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.size > 0:
+            self.mm.close()
+        self._file.close()
+
+
+class LargeFileView(Gtk.Box):
+    """
+    A read-only view that only shows the visible window of lines of a
+    file, paging new lines in as the user scrolls. file_format is the
+    umtelibs.encoding.FileFormat the file is decoded with.
+    """
+
+    def __init__(self, path, file_format=None, *args, **kwds):
+        super(LargeFileView, self).__init__(*args, **kwds)
+        self.set_orientation(Gtk.Orientation.HORIZONTAL)
+
+        self.index = LineIndex(path, file_format)
+        self.first_line = 0
+        self.page_lines = 50
+
+        self.buff = GtkSource.Buffer()
+        self.view = GtkSource.View.new_with_buffer(self.buff)
+        self.view.set_editable(False)
+        self.view.set_cursor_visible(False)
+        self.view.connect("scroll-event", self.on_scroll_event)
+        self.view.connect("key-press-event", self.on_key_press_event)
+        self.view.connect("size-allocate", self.on_size_allocate)
+
+        self.adjustment = Gtk.Adjustment(0, 0, 1, 1, self.page_lines,
+                                         self.page_lines)
+        self.adjustment.connect("value-changed", self.on_value_changed)
+        self.scrollbar = Gtk.Scrollbar(orientation=Gtk.Orientation.VERTICAL,
+                                       adjustment=self.adjustment)
+
+        self.pack_start(self.view, True, True, 0)
+        self.pack_start(self.scrollbar, False, False, 0)
+
+        self.index.build(self.on_index_progress)
+        self.show_page()
+
+    def show_page(self):
+        """Put the lines from self.first_line onwards into the view."""
+        lines = self.index.get_lines(self.first_line, self.page_lines)
+        self.buff.set_text("\n".join(lines))
+
+    def scroll_to_line(self, line):
+        line = max(0, min(line, self.adjustment.get_upper() - self.page_lines))
+        self.adjustment.set_value(line)
+
+    def on_index_progress(self):
+        upper = max(self.index.estimate_line_count(), self.page_lines)
+        self.adjustment.set_upper(upper)
+        return False
+
+    def on_value_changed(self, adjustment):
+        first_line = int(adjustment.get_value())
+        if first_line != self.first_line:
+            self.first_line = first_line
+            self.show_page()
+
+    def on_scroll_event(self, widget, event):
+        if event.direction == Gdk.ScrollDirection.UP:
+            self.scroll_to_line(self.first_line - 3)
+        elif event.direction == Gdk.ScrollDirection.DOWN:
+            self.scroll_to_line(self.first_line + 3)
+        elif event.direction == Gdk.ScrollDirection.SMOOTH:
+            self.scroll_to_line(self.first_line + int(round(event.delta_y * 3)))
+        return True
+
+    def on_key_press_event(self, widget, event):
+        moves = {
+            Gdk.KEY_Up: -1,
+            Gdk.KEY_Down: 1,
+            Gdk.KEY_Page_Up: -self.page_lines,
+            Gdk.KEY_Page_Down: self.page_lines,
+        }
+        if event.keyval in moves:
+            self.scroll_to_line(self.first_line + moves[event.keyval])
+            return True
+        elif event.keyval == Gdk.KEY_Home:
+            self.scroll_to_line(0)
+            return True
+        elif event.keyval == Gdk.KEY_End:
+            self.scroll_to_line(self.adjustment.get_upper())
+            return True
+        return False
+
+    def on_size_allocate(self, widget, allocation):
+        """Work out how many lines fit in the view when it's resized."""
+        y, line_height = self.view.get_line_yrange(self.buff.get_start_iter())
+        page_lines = max(1, allocation.height // max(1, line_height))
+        if page_lines != self.page_lines:
+            self.page_lines = page_lines
+            self.adjustment.set_page_size(page_lines)
+            self.adjustment.set_page_increment(page_lines)
+            # Don't resize the view from inside its own size-allocate.
+            GLib.idle_add(self._refresh)
+
+    def _refresh(self):
+        self.show_page()
+        return False
+
+    def close(self):
+        self.index.close()
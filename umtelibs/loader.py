@@ -0,0 +1,198 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/loader.py
+
+Loads files into a buffer a chunk at a time so the window never freezes
+while a big file is being read.
+"""
+
+import os
+import threading
+from gi.repository import GLib
+from umtelibs.encoding import FileFormat, FALLBACK_ENCODING
+
+# How many bytes are read from the disk at a time.
+CHUNK_SIZE = 256 * 1024
+# How many chunks may be waiting for the main loop at once. This keeps
+# a fast disk from piling the whole file up in memory.
+MAX_PENDING_CHUNKS = 8
+
+
+class FileLoader(object):
+    """
+    Read a file in a worker thread and append it to a buffer from the
+    main loop.
+
+    The worker reads CHUNK_SIZE bytes at a time, decodes them and hands
+    each piece to the main loop with GLib.idle_add, where it is appended
+    to the end of the buffer. The first chunk shows up right away and the
+    rest streams in while the editor stays responsive.
+
+    on_progress(fraction) is called after every chunk, on_done() once the
+    whole file is in the buffer, and on_error(exception) if reading fails.
+    All three are called from the main loop.
+
+    A UTF-8 file with an invalid byte past the part that was looked at to
+    detect its format is loaded again from the start as latin-1, and
+    self.file_format is changed to match.
+    """
+
+    def __init__(self, buff, path, file_format=None,
+                 on_progress=None, on_done=None, on_error=None):
+        self.buff = buff
+        self.path = path
+        if file_format is None:
+            file_format = FileFormat()
+        self.file_format = file_format
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_error = on_error
+
+        self.total_size = 0
+        self.loaded_size = 0
+        self.cancelled = False
+        self.finished = False
+
+        self._cancel_event = threading.Event()
+        self._pending = threading.Semaphore(MAX_PENDING_CHUNKS)
+        self._thread = None
+
+    def start(self):
+        """Clear the buffer and start reading the file in the background."""
+        # Raises OSError straight away if the file can't be opened, so
+        # the caller can show its usual error dialog.
+        _file = open(self.path, 'rb')
+        self.total_size = os.fstat(_file.fileno()).st_size
+        # Skip the byte order mark, it's written back when saving.
+        _file.seek(len(self.file_format.bom))
+        self.loaded_size = len(self.file_format.bom)
+
+        # Loading a file shouldn't end up in the undo history.
+        self.buff.begin_not_undoable_action()
+        self.buff.set_text("")
+
+        self._thread = threading.Thread(target=self._read, args=(_file,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def cancel(self, notify=True):
+        """
+        Stop loading, keeping whatever has been read so far. on_done()
+        is called as usual unless notify is False, for when the buffer
+        is about to be thrown away or loaded again.
+        """
+        if self.finished:
+            return
+        if not notify:
+            self.on_done = None
+            self.on_error = None
+        self.cancelled = True
+        self._cancel_event.set()
+        # Wake up the worker if it's waiting on the main loop.
+        self._pending.release()
+        self._finish()
+
+    def _read(self, _file):
+        """Worker thread: read, decode and queue the file chunk by chunk."""
+        try:
+            with _file:
+                file_format = self.file_format
+                try:
+                    self._read_chunks(_file, file_format)
+                except UnicodeDecodeError:
+                    if file_format.encoding != 'utf-8':
+                        raise
+                    # Every byte is valid latin-1, so it can't fail again.
+                    file_format = FileFormat(FALLBACK_ENCODING,
+                                             file_format.newline,
+                                             file_format.bom)
+                    # Runs after the chunks already queued, and before
+                    # the ones read from now on.
+                    GLib.idle_add(self._restart, file_format)
+                    _file.seek(len(file_format.bom))
+                    self._read_chunks(_file, file_format)
+        except (IOError, UnicodeDecodeError) as e:
+            GLib.idle_add(self._fail, e)
+            return
+
+        GLib.idle_add(self._finish)
+
+    def _read_chunks(self, _file, file_format):
+        decoder = file_format.get_decoder()
+        while not self._cancel_event.is_set():
+            data = _file.read(CHUNK_SIZE)
+            text = decoder.decode(data, final=not data)
+            if text:
+                self._pending.acquire()
+                if self._cancel_event.is_set():
+                    break
+                GLib.idle_add(self._append, text, len(data))
+            if not data:
+                break
+
+    def _restart(self, file_format):
+        """Main loop: throw away what was loaded, it's being read again."""
+        if self.cancelled:
+            return False
+        self.file_format = file_format
+        self.buff.set_text("")
+        self.loaded_size = len(self.file_format.bom)
+        return False
+
+    def _append(self, text, size):
+        """Main loop: append a decoded chunk to the end of the buffer."""
+        self._pending.release()
+        if self.cancelled:
+            return False
+
+        self.buff.insert(self.buff.get_end_iter(), text, -1)
+        self.loaded_size += size
+
+        if self.on_progress is not None:
+            self.on_progress(self.get_fraction())
+        return False
+
+    def _finish(self):
+        if self.finished:
+            return False
+        self.finished = True
+        self.buff.end_not_undoable_action()
+        # Leave the cursor at the top of the file instead of the end.
+        self.buff.place_cursor(self.buff.get_start_iter())
+
+        if self.on_done is not None:
+            self.on_done()
+        return False
+
+    def _fail(self, exception):
+        if self.finished:
+            return False
+        self.finished = True
+        self.buff.end_not_undoable_action()
+
+        if self.on_error is not None:
+            self.on_error(exception)
+        return False
+
+    def get_fraction(self):
+        """Return how much of the file has been loaded, from 0.0 to 1.0"""
+        if self.total_size == 0:
+            return 1.0
+        return min(1.0, self.loaded_size / self.total_size)
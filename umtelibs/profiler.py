@@ -0,0 +1,180 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/profiler.py
+
+umte --profile-startup[=trace.json]: time each phase of startup.
+
+The wall time and the Python memory allocated by each phase are printed
+once the window is first drawn. Given a file name, a trace is written
+to it too, in the Trace Event format that chrome://tracing and Perfetto
+load.
+
+Everything here does nothing unless start() found the option, so the
+phases can be marked in umte without slowing down a normal run.
+"""
+
+import os
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+OPTION = "--profile-startup"
+
+_profiler = None
+
+
+class Phase(object):
+    """One timed part of startup."""
+
+    def __init__(self, name, start, memory):
+        self.name = name
+        self.start = start
+        self.end = start
+        # Python memory in use when the phase started.
+        self.memory = memory
+        # Bytes still allocated at the end of the phase, and the most
+        # that was allocated at any point during it.
+        self.allocated = 0
+        self.peak = 0
+
+
+class StartupProfiler(object):
+    """
+    Records the phases of startup. Phases can be nested, the peak of an
+    outer phase then only covers what happened after the inner ones.
+    """
+
+    def __init__(self, trace_file=None):
+        self.trace_file = trace_file
+        self.origin = time.perf_counter()
+        self.phases = []
+        self.stack = []
+        tracemalloc.start()
+
+    def begin(self, name):
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        phase = Phase(name, time.perf_counter(),
+                      tracemalloc.get_traced_memory()[0])
+        self.stack.append(phase)
+
+    def end(self):
+        phase = self.stack.pop()
+        phase.end = time.perf_counter()
+        current, peak = tracemalloc.get_traced_memory()
+        phase.allocated = current - phase.memory
+        phase.peak = max(0, peak - phase.memory)
+        self.phases.append(phase)
+
+    def finish(self):
+        """Close any open phases, print the breakdown and write the trace."""
+        while self.stack:
+            self.end()
+        total = time.perf_counter() - self.origin
+        self.report(total)
+        if self.trace_file is not None:
+            self.write_trace()
+        tracemalloc.stop()
+
+    def report(self, total):
+        print("umte startup, {:.1f} ms to the first draw".format(total * 1000))
+        print("{:<24} {:>10} {:>7} {:>14} {:>12}".format(
+            "phase", "ms", "%", "allocated KiB", "peak KiB"))
+        for phase in sorted(self.phases, key=lambda phase: phase.start):
+            duration = phase.end - phase.start
+            print("{:<24} {:>10.1f} {:>6.1f}% {:>14.1f} {:>12.1f}".format(
+                phase.name, duration * 1000, 100 * duration / total,
+                phase.allocated / 1024, phase.peak / 1024))
+        print("(only memory allocated by Python is counted)")
+
+    def write_trace(self):
+        pid = os.getpid()
+        events = []
+        for phase in self.phases:
+            events.append({
+                "name": phase.name,
+                "cat": "startup",
+                "ph": "X",
+                "ts": (phase.start - self.origin) * 1e6,
+                "dur": (phase.end - phase.start) * 1e6,
+                "pid": pid,
+                "tid": 1,
+                "args": {"allocated": phase.allocated, "peak": phase.peak},
+            })
+            events.append({
+                "name": "python memory",
+                "ph": "C",
+                "ts": (phase.end - self.origin) * 1e6,
+                "pid": pid,
+                "args": {"bytes": phase.memory + phase.allocated},
+            })
+        try:
+            with open(self.trace_file, 'w', encoding='utf-8') as _file:
+                json.dump({"traceEvents": events,
+                           "displayTimeUnit": "ms"}, _file)
+            print("Trace written to " + self.trace_file)
+        except IOError as e:
+            print("Unable to write the trace: " + str(e))
+
+
+def start(argv):
+    """
+    Start profiling if argv has --profile-startup in it, removing the
+    option from argv so it isn't taken for a file.
+    """
+    global _profiler
+    for i, arg in enumerate(argv):
+        if arg == OPTION or arg.startswith(OPTION + "="):
+            del argv[i]
+            trace_file = arg[len(OPTION) + 1:] or None
+            _profiler = StartupProfiler(trace_file)
+            return
+
+
+def is_running():
+    return _profiler is not None
+
+
+def begin(name):
+    if _profiler is not None:
+        _profiler.begin(name)
+
+
+def end():
+    if _profiler is not None:
+        _profiler.end()
+
+
+@contextmanager
+def phase(name):
+    begin(name)
+    try:
+        yield
+    finally:
+        end()
+
+
+def finish():
+    """Report the phases. Profiling stops, later phases are ignored."""
+    global _profiler
+    if _profiler is not None:
+        _profiler.finish()
+        _profiler = None
@@ -0,0 +1,166 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/replace.py
+
+Replace all for the find box.
+
+The matches are found in a worker thread from a snapshot of the
+document. The edits are then made to the buffer from an idle callback,
+a few milliseconds at a time, all inside one user action so a single
+undo puts everything back.
+"""
+
+import re
+import time
+import threading
+from gi.repository import GLib
+from umtelibs.search import TIME_BUDGET
+
+# Matches closer together than this many characters are replaced with a
+# single edit, so dense matches don't cost one delete and insert each.
+MERGE_GAP = 256
+
+
+def find_edits(snapshot, regex, replacement, is_cancelled=lambda: False):
+    """
+    Return (edits, count) for replacing every match of regex in snapshot
+    with replacement. edits is a list of (start, end, text) in order and
+    count is the number of matches. Returns (None, count) if cancelled.
+    """
+    edits = []
+    count = 0
+    replace = lambda match: replacement
+    for offset, block in snapshot.iter_lines():
+        if is_cancelled():
+            return None, count
+        span_start = span_end = None
+        for match in regex.finditer(block):
+            if match.end() == match.start():
+                continue
+            count += 1
+            if span_end is not None and match.start() - span_end <= MERGE_GAP:
+                span_end = match.end()
+                continue
+            if span_start is not None:
+                edits.append((offset + span_start, offset + span_end,
+                              regex.sub(replace, block[span_start:span_end])))
+            span_start, span_end = match.start(), match.end()
+        if span_start is not None:
+            edits.append((offset + span_start, offset + span_end,
+                          regex.sub(replace, block[span_start:span_end])))
+    return edits, count
+
+
+class ReplaceAll(object):
+    """
+    Replaces every occurrence of a string in buff.
+
+    document is the umtelibs.document.Document mirroring buff. While
+    the edits are made on_progress(fraction) is called now and then, and
+    on_done(count, cancelled) is called at the end.
+    """
+
+    def __init__(self, buff, document, on_progress, on_done):
+        self.buff = buff
+        self.document = document
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.cancelled = False
+        self.snapshot = None
+        self.edits = []
+        self.total = 0
+        self.count = 0
+        self.applied = 0
+        # The document as the last edit left it.
+        self.root = None
+        self.source_id = None
+        self.in_user_action = False
+
+    def start(self, find, replacement):
+        self.snapshot = self.document.snapshot()
+        regex = re.compile(re.escape(find))
+        thread = threading.Thread(target=self._find,
+                                  args=(regex, replacement))
+        thread.daemon = True
+        thread.start()
+
+    def _find(self, regex, replacement):
+        edits, count = find_edits(self.snapshot, regex, replacement,
+                                  lambda: self.cancelled)
+        GLib.idle_add(self._found, edits, count)
+
+    def _found(self, edits, count):
+        if self.cancelled:
+            return False
+        if self.document.snapshot().root is not self.snapshot.root:
+            # Edited while looking, the offsets are no good.
+            self.finish(True)
+            return False
+        # Made from the end backwards, so the offsets of the edits still
+        # to come aren't moved by the ones already made.
+        self.edits = edits
+        self.total = len(edits)
+        self.count = count
+        self.root = self.snapshot.root
+        self.buff.begin_user_action()
+        self.in_user_action = True
+        self.source_id = GLib.idle_add(self._apply)
+        return False
+
+    def _apply(self):
+        if self.document.root is not self.root:
+            # Something else edited the buffer, the offsets are no good.
+            self.source_id = None
+            self.cancel()
+            return False
+        deadline = time.monotonic() + TIME_BUDGET
+        buff = self.buff
+        while self.edits:
+            start, end, text = self.edits.pop()
+            start_iter = buff.get_iter_at_offset(start)
+            buff.delete(start_iter, buff.get_iter_at_offset(end))
+            buff.insert(start_iter, text)
+            self.root = self.document.root
+            self.applied += 1
+            if time.monotonic() > deadline:
+                self.on_progress(self.applied / self.total)
+                return True
+        self.source_id = None
+        self.finish(False)
+        return False
+
+    def finish(self, cancelled):
+        if self.in_user_action:
+            self.buff.end_user_action()
+            self.in_user_action = False
+            if cancelled and self.applied:
+                # Take back the part that was done.
+                self.buff.undo()
+        self.on_done(0 if cancelled else self.count, cancelled)
+
+    def cancel(self):
+        """Stop, leaving the buffer as it was before."""
+        if self.cancelled:
+            return
+        self.cancelled = True
+        if self.source_id is not None:
+            GLib.source_remove(self.source_id)
+            self.source_id = None
+        self.finish(True)
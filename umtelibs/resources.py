@@ -0,0 +1,98 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/resources.py
+
+Finds the files umte ships with (the ui and the icons) and loads them.
+
+Paths are relative to where umte is installed, not to the directory it
+was started from. The ui is given to Gtk.Builder from a copy in
+~/.cache/umte/ui/ with the comments and the indentation taken out, made
+the first time umte runs after the glade file changes.
+"""
+
+import os
+import re
+import xdg.BaseDirectory
+from umtelibs.saver import save_chunks
+
+# The directory umte.py, ui/ and icons/ are in.
+ROOT = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+
+# Whitespace between tags that has a line break in it is only there to
+# make the file readable. Whitespace without one could be a label.
+INDENT = re.compile(r">\s*\n\s*<")
+
+
+def get_path(*parts):
+    """Return the path of a file umte ships with, like get_path("ui", "umte.glade")."""
+    return os.path.join(ROOT, *parts)
+
+
+def minify_ui(text):
+    """Return the glade xml in text without comments or indentation."""
+    return INDENT.sub("><", COMMENT.sub("", text)).strip()
+
+
+def get_cached_ui(name, program_name):
+    """
+    Return the minified text of ui/name, from the cache if it's there
+    and the glade file hasn't changed since.
+    """
+    path = get_path("ui", name)
+    st = os.stat(path)
+    cache_path = xdg.BaseDirectory.save_cache_path(program_name, "ui")
+    base = os.path.splitext(name)[0]
+    cache_file = os.path.join(cache_path, "{}-{}-{}.ui".format(
+        base, st.st_mtime_ns, st.st_size))
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as _file:
+            return _file.read()
+    except IOError:
+        pass
+
+    with open(path, 'r', encoding='utf-8') as _file:
+        text = minify_ui(_file.read())
+    try:
+        # Copies of older versions of the file aren't needed any more.
+        for old in os.listdir(cache_path):
+            if old.startswith(base + "-") and old.endswith(".ui"):
+                os.unlink(os.path.join(cache_path, old))
+        save_chunks([text.encode('utf-8')], cache_file)
+    except (IOError, OSError):
+        print("Unable to cache the ui in " + cache_path)
+    return text
+
+
+def load_ui(builder, name, program_name):
+    """Add ui/name to builder."""
+    try:
+        text = get_cached_ui(name, program_name)
+    except (IOError, OSError, UnicodeDecodeError):
+        builder.add_from_file(get_path("ui", name))
+        return
+    builder.add_from_string(text)
+
+
+def load_pixbuf(*parts):
+    """Decode the image at get_path(*parts) into a GdkPixbuf.Pixbuf."""
+    from gi.repository import GdkPixbuf
+    return GdkPixbuf.Pixbuf.new_from_file(get_path(*parts))
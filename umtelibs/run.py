@@ -0,0 +1,383 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/run.py
+
+Runs the current file and shows what it prints.
+
+The interpreter comes from the file's #! line, or else from the language
+it's highlighted as. Its stdout and stderr are read through GLib IO
+watches as the output arrives, so the main loop never waits on it, and
+only the last MAX_LINES lines are kept, so a script that prints forever
+can't use up the memory. Lines like "file.py:12" or
+'File "file.py", line 12' can be clicked to go there.
+"""
+
+import os
+import re
+import codecs
+import shlex
+import signal
+from collections import deque
+from gi.repository import Gtk, Gdk, GLib, Pango
+
+# How many lines of output are kept.
+MAX_LINES = 10000
+
+# Longer lines are split.
+MAX_LINE_LENGTH = 4096
+
+# How much is read from a pipe each time there's something to read.
+READ_SIZE = 64 * 1024
+
+# How often new output is put on screen, in milliseconds.
+FLUSH_INTERVAL = 50
+
+# Interpreters for files without a #! line, by GtkSource language id.
+INTERPRETERS = {
+    "python": ["python3"],
+    "python3": ["python3"],
+    "sh": ["sh"],
+    "perl": ["perl"],
+    "ruby": ["ruby"],
+    "lua": ["lua"],
+    "php": ["php"],
+    "js": ["node"],
+    "tcl": ["tclsh"],
+}
+
+# Python tracebacks, then the file:line[:column] most tools print.
+LOCATIONS = [
+    re.compile(r'File "(?P<path>[^"]+)", line (?P<line>\d+)'),
+    re.compile(r'(?P<path>[^\s:"\'()]+):(?P<line>\d+)(?::(?P<column>\d+))?'),
+]
+
+
+def get_command(path, language_id=None):
+    """
+    Return the argv that runs the file at path, or None if it's not
+    known how.
+    """
+    try:
+        with open(path, 'rb') as _file:
+            first_line = _file.readline(1024)
+    except IOError:
+        return None
+    if first_line.startswith(b"#!"):
+        interpreter = shlex.split(first_line[2:].decode('utf-8', 'replace'))
+        if interpreter:
+            return interpreter + [path]
+    if language_id in INTERPRETERS:
+        return INTERPRETERS[language_id] + [path]
+    return None
+
+
+def find_location(text):
+    """
+    Return (start, end, path, line, column) for the first place a file
+    is named in text, or None. column is None if it isn't given.
+    """
+    for pattern in LOCATIONS:
+        match = pattern.search(text)
+        if match is not None:
+            column = match.groupdict().get("column")
+            return (match.start(), match.end(), match.group("path"),
+                    int(match.group("line")),
+                    int(column) if column else None)
+    return None
+
+
+class OutputBuffer(object):
+    """
+    The last max_lines lines a program printed, as (text, is_error).
+    total counts every line ever added, so a reader can tell how many
+    are new since it last looked.
+    """
+
+    def __init__(self, max_lines=MAX_LINES):
+        self.lines = deque(maxlen=max_lines)
+        self.total = 0
+
+    def append(self, text, is_error):
+        self.lines.append((text, is_error))
+        self.total += 1
+
+    def get_new_lines(self, seen):
+        """
+        Return the lines added after the first seen, and whether some of
+        them were dropped before they could be read.
+        """
+        new = self.total - seen
+        dropped = new > len(self.lines)
+        new = min(new, len(self.lines))
+        start = len(self.lines) - new
+        return [self.lines[i] for i in range(start, len(self.lines))], dropped
+
+
+class Stream(object):
+    """One of the pipes of a running program."""
+
+    def __init__(self, fd, is_error):
+        self.fd = fd
+        self.is_error = is_error
+        self.decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        # The start of a line that hasn't ended yet.
+        self.partial = ""
+
+
+class Runner(object):
+    """
+    Runs argv in working_directory and adds its output to output.
+
+    on_output(runner) is called when lines have been added, and
+    on_finished(runner, code) once the program has exited and both pipes
+    are closed. code is the exit status, or minus the signal that
+    killed it.
+    """
+
+    def __init__(self, argv, working_directory, output, on_output, on_finished):
+        self.argv = argv
+        self.output = output
+        self.on_output = on_output
+        self.on_finished = on_finished
+        self.code = None
+        self.streams = []
+
+        flags = GLib.SpawnFlags.SEARCH_PATH | GLib.SpawnFlags.DO_NOT_REAP_CHILD
+        self.pid, stdin, stdout, stderr = GLib.spawn_async(
+            argv, working_directory=working_directory, flags=flags,
+            standard_output=True, standard_error=True)
+        # Below the redraws, so a program that never stops printing
+        # can't freeze the window.
+        for fd, is_error in ((stdout, False), (stderr, True)):
+            stream = Stream(fd, is_error)
+            self.streams.append(stream)
+            GLib.io_add_watch(fd, GLib.PRIORITY_DEFAULT_IDLE,
+                              GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR,
+                              self.on_readable, stream)
+        GLib.child_watch_add(GLib.PRIORITY_DEFAULT_IDLE, self.pid, self.on_exit)
+
+    def is_running(self):
+        return self.code is None
+
+    def stop(self):
+        """Ask the program to stop."""
+        if self.code is None:
+            try:
+                os.kill(self.pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+    def add_text(self, stream, text):
+        lines = (stream.partial + text).split("\n")
+        stream.partial = lines.pop()
+        while len(stream.partial) > MAX_LINE_LENGTH:
+            lines.append(stream.partial[:MAX_LINE_LENGTH])
+            stream.partial = stream.partial[MAX_LINE_LENGTH:]
+        for line in lines:
+            while len(line) > MAX_LINE_LENGTH:
+                self.output.append(line[:MAX_LINE_LENGTH], stream.is_error)
+                line = line[MAX_LINE_LENGTH:]
+            self.output.append(line.rstrip("\r"), stream.is_error)
+
+    def on_readable(self, fd, condition, stream):
+        try:
+            data = os.read(fd, READ_SIZE)
+        except OSError:
+            data = b""
+        if data:
+            self.add_text(stream, stream.decoder.decode(data))
+            self.on_output(self)
+            return True
+
+        # The end of the pipe.
+        self.add_text(stream, stream.decoder.decode(b"", True))
+        if stream.partial:
+            self.output.append(stream.partial, stream.is_error)
+            stream.partial = ""
+        self.on_output(self)
+        os.close(fd)
+        self.streams.remove(stream)
+        self.check_finished()
+        return False
+
+    def on_exit(self, pid, status):
+        GLib.spawn_close_pid(pid)
+        if os.WIFSIGNALED(status):
+            self.code = -os.WTERMSIG(status)
+        else:
+            self.code = os.WEXITSTATUS(status)
+        self.check_finished()
+
+    def check_finished(self):
+        if self.code is not None and not self.streams:
+            self.on_finished(self, self.code)
+
+
+class OutputPane(Gtk.Box):
+    """
+    Shows the output of the program being run. on_location(path, line,
+    column) is called when a file named in the output is clicked.
+    """
+
+    def __init__(self, on_location, *args, **kwds):
+        super(OutputPane, self).__init__(*args, **kwds)
+        self.set_orientation(Gtk.Orientation.VERTICAL)
+        self.on_location = on_location
+        self.runner = None
+        self.output = None
+        self.working_directory = None
+        # How many lines of output are on screen.
+        self.shown = 0
+        self.flush_id = None
+
+        header = Gtk.Box(spacing=4)
+        header.set_border_width(2)
+        self.label = Gtk.Label(xalign=0)
+        self.label.set_ellipsize(Pango.EllipsizeMode.MIDDLE)
+        self.stop_button = Gtk.Button.new_with_label("Stop")
+        self.stop_button.connect("clicked", self.on_stop_clicked)
+        close_button = Gtk.Button.new_with_label("Close")
+        close_button.connect("clicked", self.on_close_clicked)
+        header.pack_start(self.label, True, True, 0)
+        header.pack_start(self.stop_button, False, False, 0)
+        header.pack_start(close_button, False, False, 0)
+
+        self.buff = Gtk.TextBuffer()
+        self.buff.create_tag("error", foreground="#c01c28")
+        self.link_tag = self.buff.create_tag(
+            "link", foreground="#1a5fb4", underline=Pango.Underline.SINGLE)
+        # Stays at the end of the output, for scrolling to.
+        self.end_mark = self.buff.create_mark(None, self.buff.get_end_iter(),
+                                              False)
+        self.view = Gtk.TextView.new_with_buffer(self.buff)
+        self.view.set_editable(False)
+        self.view.set_monospace(True)
+        self.view.connect("button-release-event", self.on_button_release)
+        self.scrolled = Gtk.ScrolledWindow()
+        self.scrolled.set_size_request(-1, 160)
+        self.scrolled.add(self.view)
+
+        self.pack_start(header, False, False, 0)
+        self.pack_start(self.scrolled, True, True, 0)
+
+    def run(self, argv, working_directory):
+        """Stop whatever is running and run argv instead."""
+        if self.runner is not None:
+            self.runner.stop()
+        self.buff.set_text("")
+        self.shown = 0
+        self.output = OutputBuffer()
+        self.working_directory = working_directory
+        title = " ".join(shlex.quote(arg) for arg in argv)
+        try:
+            self.runner = Runner(argv, working_directory, self.output,
+                                 self.queue_flush, self.on_finished)
+        except GLib.Error as e:
+            self.runner = None
+            self.label.set_text("Unable to run " + title + ": " + e.message)
+            self.stop_button.set_sensitive(False)
+            return
+        self.label.set_text("Running " + title)
+        self.stop_button.set_sensitive(True)
+
+    def queue_flush(self, runner):
+        # Output from a program that was stopped for this one is ignored.
+        if runner is self.runner and self.flush_id is None:
+            self.flush_id = GLib.timeout_add(FLUSH_INTERVAL, self.flush)
+
+    def flush(self):
+        """Put the output that's come in since the last flush on screen."""
+        self.flush_id = None
+        lines, dropped = self.output.get_new_lines(self.shown)
+        self.shown = self.output.total
+        if not lines:
+            return False
+        adjustment = self.scrolled.get_vadjustment()
+        at_bottom = adjustment.get_value() >= \
+            adjustment.get_upper() - adjustment.get_page_size() - 1
+        if dropped:
+            self.buff.set_text("")
+
+        for text, is_error in lines:
+            end = self.buff.get_end_iter()
+            offset = end.get_offset()
+            if is_error:
+                self.buff.insert_with_tags_by_name(end, text + "\n", "error")
+            else:
+                self.buff.insert(end, text + "\n")
+            location = find_location(text)
+            if location is not None and self.get_path(location[2]):
+                start, stop = location[:2]
+                self.buff.apply_tag(self.link_tag,
+                                    self.buff.get_iter_at_offset(offset + start),
+                                    self.buff.get_iter_at_offset(offset + stop))
+
+        # Keep the buffer as short as the output.
+        excess = self.buff.get_line_count() - 1 - MAX_LINES
+        if excess > 0:
+            self.buff.delete(self.buff.get_start_iter(),
+                             self.buff.get_iter_at_line(excess))
+        if at_bottom:
+            self.view.scroll_to_mark(self.end_mark, 0, False, 0, 0)
+        return False
+
+    def get_path(self, path):
+        """Return path relative to where the program runs, or None if
+        there's no such file."""
+        path = os.path.join(self.working_directory, os.path.expanduser(path))
+        return path if os.path.isfile(path) else None
+
+    def on_finished(self, runner, code):
+        if runner is not self.runner:
+            return
+        self.stop_button.set_sensitive(False)
+        if code < 0:
+            status = "killed by signal {}".format(-code)
+        else:
+            status = "exited with status {}".format(code)
+        self.label.set_text(self.label.get_text().replace("Running ", "", 1) +
+                            " " + status)
+
+    def on_stop_clicked(self, widget, data=None):
+        if self.runner is not None:
+            self.runner.stop()
+
+    def on_close_clicked(self, widget, data=None):
+        self.hide()
+
+    def on_button_release(self, widget, event):
+        if event.button != Gdk.BUTTON_PRIMARY or self.buff.get_has_selection():
+            return False
+        x, y = self.view.window_to_buffer_coords(Gtk.TextWindowType.WIDGET,
+                                                 int(event.x), int(event.y))
+        found, position = self.view.get_iter_at_location(x, y)
+        if not found or not position.has_tag(self.link_tag):
+            return False
+        start = position.copy()
+        start.set_line_offset(0)
+        end = start.copy()
+        end.forward_to_line_end()
+        location = find_location(self.buff.get_text(start, end, True))
+        if location is None:
+            return False
+        path = self.get_path(location[2])
+        if path is not None:
+            self.on_location(path, location[3], location[4])
+        return True
@@ -0,0 +1,236 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/saver.py
+
+Saving files safely.
+
+Text is streamed to a temporary file next to the real one a chunk at a
+time, which is then fsync'd and renamed over the real file. If umte
+crashes halfway through a save the old file is still there.
+"""
+
+import os
+import hashlib
+import tempfile
+import threading
+from umtelibs.encoding import FileFormat
+
+# How many characters are taken from the buffer at a time.
+CHUNK_SIZE = 256 * 1024
+
+
+def ensure_newline(chunks):
+    """Yield chunks of text, adding a newline if the text doesn't end in one."""
+    last_char = None
+    for chunk in chunks:
+        if chunk:
+            last_char = chunk[-1]
+            yield chunk
+
+    if last_char != "\n":
+        yield "\n"
+
+
+def buffer_chunks(buff, chunk_size=CHUNK_SIZE):
+    """
+    Yield the text of a Gtk.TextBuffer chunk_size characters at a time,
+    making sure it ends with a newline.
+    """
+    def chunks():
+        start = buff.get_start_iter()
+        while not start.is_end():
+            end = start.copy()
+            end.forward_chars(chunk_size)
+            yield buff.get_text(start, end, False)
+            start = end
+
+    return ensure_newline(chunks())
+
+
+def string_chunks(text, chunk_size=CHUNK_SIZE):
+    """
+    Yield a string chunk_size characters at a time, making sure it ends
+    with a newline.
+    """
+    return ensure_newline(text[i:i + chunk_size]
+                          for i in range(0, len(text), chunk_size))
+
+
+def get_umask():
+    """Return the process's umask."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def get_stat(file_path):
+    """Return the (mtime, size) of file_path, or None if it doesn't exist."""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def hash_chunks(chunks):
+    """Return a hash of chunks of bytes."""
+    content_hash = hashlib.sha1()
+    for chunk in chunks:
+        content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def save_chunks(chunks, file_path, should_replace=None):
+    """
+    Atomically write chunks of bytes to file_path and return their hash.
+
+    The chunks are written to a temporary file in the same directory,
+    which is fsync'd and renamed over file_path. The permissions of the
+    old file are kept. If anything goes wrong the temporary file is
+    removed and the old file is left alone.
+
+    should_replace, if given, is called once all the chunks have been
+    written. If it returns False the temporary file is thrown away
+    instead, and None is returned.
+    """
+    # Write through symlinks instead of replacing them.
+    file_path = os.path.realpath(file_path)
+    directory = os.path.dirname(file_path)
+
+    try:
+        mode = os.stat(file_path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = 0o666 & ~get_umask()
+
+    fd, temp_path = tempfile.mkstemp(prefix="." + os.path.basename(file_path),
+                                     suffix=".umte-tmp", dir=directory)
+    content_hash = hashlib.sha1()
+    try:
+        with os.fdopen(fd, 'wb') as _file:
+            for chunk in chunks:
+                content_hash.update(chunk)
+                _file.write(chunk)
+            if should_replace is not None and not should_replace():
+                replace = False
+            else:
+                replace = True
+                _file.flush()
+                os.fsync(_file.fileno())
+        if not replace:
+            os.unlink(temp_path)
+            return None
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, file_path)
+    except:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+    # Make sure the rename itself makes it to the disk.
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        pass
+    else:
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        os.close(dir_fd)
+
+    return content_hash.hexdigest()
+
+
+class Saver(object):
+    """
+    Saves files with save_chunks and remembers what was last saved to
+    each path so saving unchanged text doesn't touch the disk at all.
+    """
+
+    def __init__(self):
+        # Maps real paths to the hash of what was last saved there and
+        # the (mtime, size) the file had right after saving it.
+        self.saved = {}
+        # Only one save runs at a time so they land on disk in order.
+        self._lock = threading.Lock()
+
+    def save(self, file_path, get_chunks, file_format=None):
+        """
+        Save the text to file_path. get_chunks is called to get a fresh
+        iterator of the text's chunks, since it may be needed twice. The
+        text is encoded in file_format, UTF-8 with "\n" line endings if
+        it's None.
+
+        Return True if the file was written, False if it already had
+        the same contents.
+        """
+        if file_format is None:
+            file_format = FileFormat()
+        with self._lock:
+            return self._save(file_path, get_chunks, file_format)
+
+    def _save(self, file_path, get_chunks, file_format):
+        real_path = os.path.realpath(file_path)
+        if real_path in self.saved:
+            last_hash, last_stat = self.saved[real_path]
+            # Only trust the hash if nobody else touched the file since.
+            if get_stat(real_path) == last_stat and \
+                    hash_chunks(file_format.encode_chunks(get_chunks())) == last_hash:
+                return False
+
+        content_hash = save_chunks(file_format.encode_chunks(get_chunks()),
+                                   real_path)
+        self.saved[real_path] = (content_hash, get_stat(real_path))
+        return True
+
+    def save_in_background(self, file_path, get_chunks, on_done,
+                           file_format=None):
+        """
+        Save the text to file_path in a worker thread. get_chunks is used
+        like in save(), and is called from the worker thread, so it must
+        only read from something that won't change, like a Snapshot.
+
+        on_done(written, error) is called from the main loop when the save
+        is over, error being None if it went well.
+
+        The worker isn't a daemon thread, so a save that's still running
+        when the main loop quits gets to finish.
+        """
+        thread = threading.Thread(target=self._save_worker,
+                                  args=(file_path, get_chunks, on_done,
+                                        file_format))
+        thread.start()
+
+    def _save_worker(self, file_path, get_chunks, on_done, file_format):
+        # Imported here so --batch, which only needs save_chunks, runs
+        # without gi installed.
+        from gi.repository import GLib
+        try:
+            written = self.save(file_path, get_chunks, file_format)
+        except (IOError, OSError, UnicodeEncodeError) as e:
+            GLib.idle_add(on_done, False, e)
+        else:
+            GLib.idle_add(on_done, written, None)
+
+    def forget(self, file_path):
+        """Forget the last saved hash of file_path."""
+        self.saved.pop(os.path.realpath(file_path), None)
@@ -0,0 +1,209 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/search.py
+
+Incremental search for the find box.
+
+The search runs from an idle callback a few milliseconds at a time, so
+typing stays responsive however big the buffer is. The part of the
+document on screen is searched first so its matches light up right
+away, then the whole document is searched to count the matches. Only
+the matches on screen are ever highlighted.
+"""
+
+import re
+import time
+import bisect
+from gi.repository import GLib
+
+# How long the search may run for each time round the main loop, in
+# seconds. Keeps well under a frame so drawing and typing aren't held up.
+TIME_BUDGET = 0.008
+
+# Lines above and below the visible area that are highlighted too, so
+# scrolling a little doesn't show unhighlighted matches.
+MARGIN_LINES = 20
+
+
+def search_blocks(regex, snapshot, start=0, end=None):
+    """
+    Yield (end, matches) for each block of lines of snapshot, end being
+    the offset the block ends at and matches a list of the (start, end)
+    offsets of the matches in it. The caller can stop between blocks.
+    """
+    for offset, block in snapshot.iter_lines(start, end):
+        yield offset + len(block), [
+            (offset + match.start(), offset + match.end())
+            for match in regex.finditer(block)
+            if match.end() > match.start()]
+
+
+class Search(object):
+    """
+    Searches the buffer of one tab at a time for a string.
+
+    on_count(count, finished) is called as matches are counted, with
+    finished True once count is the total.
+    """
+
+    def __init__(self, on_count):
+        self.on_count = on_count
+        self.tab = None
+        self.text = ""
+        self.regex = None
+        self.snapshot = None
+        # Every match found so far, in order.
+        self.matches = []
+        # The offset the whole document search has got up to.
+        self.searched = 0
+        self.finished = False
+        self.steps = None
+        self.source_id = None
+        self.handler_ids = []
+
+    def start(self, tab, text):
+        """Search tab for text, cancelling any search already running."""
+        self.cancel()
+        if not text or tab.buff is None or tab.large_view is not None:
+            self.on_count(0, True)
+            return
+        self.tab = tab
+        self.text = text
+        self.regex = re.compile(re.escape(text))
+        self.snapshot = tab.document.snapshot()
+        self.matches = []
+        self.searched = 0
+        self.finished = False
+
+        buff = tab.buff
+        if buff.get_tag_table().lookup("search-match") is None:
+            buff.create_tag("search-match", background="yellow",
+                            foreground="black")
+        self.handler_ids = [
+            (buff, buff.connect("changed", self.on_buffer_changed)),
+            (tab.scroll.get_vadjustment(),
+             tab.scroll.get_vadjustment().connect("value-changed",
+                                                  self.on_scrolled)),
+        ]
+
+        self.highlight_visible()
+        self.steps = self.search()
+        self.source_id = GLib.idle_add(self.step)
+
+    def cancel(self):
+        """Stop searching and remove the highlighting."""
+        if self.source_id is not None:
+            GLib.source_remove(self.source_id)
+            self.source_id = None
+        for widget, handler_id in self.handler_ids:
+            widget.disconnect(handler_id)
+        self.handler_ids = []
+        if self.tab is not None and self.tab.buff is not None:
+            self.clear_highlight()
+        self.tab = None
+        self.steps = None
+        self.snapshot = None
+        self.matches = []
+
+    def search(self):
+        """Count the matches in the whole document, a block at a time."""
+        for self.searched, found in search_blocks(self.regex, self.snapshot):
+            self.matches.extend(found)
+            yield
+
+    def step(self):
+        deadline = time.monotonic() + TIME_BUDGET
+        for _ in self.steps:
+            if time.monotonic() > deadline:
+                self.on_count(len(self.matches), False)
+                return True
+        self.finished = True
+        self.source_id = None
+        self.on_count(len(self.matches), True)
+        return False
+
+    def get_visible_range(self):
+        """Return the offsets of the start and end of what's on screen."""
+        view = self.tab.text_area
+        rect = view.get_visible_rect()
+        first, line_top = view.get_line_at_y(rect.y)
+        last, line_top = view.get_line_at_y(rect.y + rect.height)
+        first.backward_lines(MARGIN_LINES)
+        last.forward_lines(MARGIN_LINES)
+        return first.get_offset(), last.get_offset()
+
+    def get_matches(self, start, end):
+        """Return the matches between the offsets start and end."""
+        if self.finished or end <= self.searched:
+            first = bisect.bisect_left(self.matches, (start, start))
+            last = bisect.bisect_left(self.matches, (end, end))
+            return self.matches[first:last]
+        # Not counted that far yet, look there directly.
+        matches = []
+        for block_end, found in search_blocks(self.regex, self.snapshot,
+                                              start, end):
+            matches.extend(found)
+        return matches
+
+    def clear_highlight(self):
+        buff = self.tab.buff
+        start, end = buff.get_bounds()
+        buff.remove_tag_by_name("search-match", start, end)
+
+    def highlight_visible(self):
+        """Highlight the matches on screen and take it off everything else."""
+        buff = self.tab.buff
+        self.clear_highlight()
+        start, end = self.get_visible_range()
+        for match_start, match_end in self.get_matches(start, end):
+            buff.apply_tag_by_name("search-match",
+                                   buff.get_iter_at_offset(match_start),
+                                   buff.get_iter_at_offset(match_end))
+
+    def find_next(self):
+        """
+        Select the next match after the cursor, going back to the first
+        one at the end. Returns False if there's nothing to select yet.
+        """
+        if self.tab is None:
+            return False
+        buff = self.tab.buff
+        cursor = buff.get_iter_at_mark(buff.get_insert())
+        bounds = buff.get_selection_bounds()
+        if bounds:
+            cursor = bounds[1]
+        i = bisect.bisect_left(self.matches, (cursor.get_offset(), 0))
+        if i == len(self.matches):
+            if not self.finished or not self.matches:
+                return False
+            i = 0
+        start, end = self.matches[i]
+        buff.select_range(buff.get_iter_at_offset(start),
+                          buff.get_iter_at_offset(end))
+        self.tab.text_area.scroll_to_mark(buff.get_insert(), 0.1,
+                                          False, 0.0, 0.0)
+        return True
+
+    def on_buffer_changed(self, buff):
+        # The offsets found so far no longer fit, start again.
+        self.start(self.tab, self.text)
+
+    def on_scrolled(self, adjustment):
+        self.highlight_visible()
@@ -0,0 +1,116 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/session.py
+
+Remembers which files were open when umte was closed, so they can be
+opened again the next time it starts.
+
+The session is kept in ~/.cache/umte/session.json.
+"""
+
+import os
+import json
+import xdg.BaseDirectory
+from umtelibs.encoding import FileFormat
+from umtelibs.saver import save_chunks
+
+# Bump this if the format of the session file changes.
+SESSION_VERSION = 1
+
+
+class SessionFile(object):
+    """
+    One file in a session: its path, where the cursor and the view were,
+    its language and its format.
+    """
+
+    def __init__(self, path, cursor=0, top_line=0, language=None,
+                 file_format=None):
+        self.path = path
+        self.cursor = cursor
+        self.top_line = top_line
+        self.language = language
+        self.file_format = file_format
+
+    def to_list(self):
+        file_format = self.file_format
+        if file_format is not None:
+            file_format = [file_format.encoding, file_format.newline,
+                           file_format.bom.hex()]
+        return [self.path, self.cursor, self.top_line, self.language,
+                file_format]
+
+    @classmethod
+    def from_list(cls, values):
+        path, cursor, top_line, language, file_format = values
+        if file_format is not None:
+            encoding, newline, bom = file_format
+            file_format = FileFormat(encoding, newline, bytes.fromhex(bom))
+        return cls(path, cursor, top_line, language, file_format)
+
+
+class Session(object):
+    """Reads and writes the session file."""
+
+    def __init__(self, program_name):
+        self.session_file = os.path.join(
+            xdg.BaseDirectory.save_cache_path(program_name), "session.json")
+
+    def save(self, files, active):
+        """
+        Write the session. files is a list of SessionFile objects and
+        active is the index of the one that was being shown.
+        """
+        data = json.dumps({
+            "version": SESSION_VERSION,
+            "active": active,
+            "files": [session_file.to_list() for session_file in files],
+        }, separators=(',', ':'))
+        try:
+            save_chunks([data.encode('utf-8')], self.session_file)
+        except (IOError, OSError):
+            print("Unable to save the session to " + self.session_file)
+
+    def load(self):
+        """
+        Read the session and return (files, active). Files that don't
+        exist anymore are left out. Returns ([], 0) if there's no session.
+        """
+        try:
+            with open(self.session_file, 'r', encoding='utf-8') as _file:
+                data = json.load(_file)
+            if data.get("version") != SESSION_VERSION:
+                return [], 0
+            files = [SessionFile.from_list(values) for values in data["files"]]
+            active = data["active"]
+        except (IOError, ValueError, KeyError, TypeError):
+            return [], 0
+
+        # Keep the active file active even if ones before it are gone.
+        if 0 <= active < len(files):
+            active_path = files[active].path
+        else:
+            active_path = None
+        files = [f for f in files if os.path.isfile(f.path)]
+        active = 0
+        for i, session_file in enumerate(files):
+            if session_file.path == active_path:
+                active = i
+        return files, active
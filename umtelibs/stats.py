@@ -0,0 +1,137 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/stats.py
+
+Line, word and character counts for the statusbar.
+
+The counts are worked out once and then kept up to date from each
+insert and delete, looking only at the text that changed and the
+character on either side of it. Typing in a huge file costs the same
+as typing in a small one.
+"""
+
+import re
+
+# A word is a run of anything but whitespace.
+WORD = re.compile(r"\S+")
+
+# Selections longer than this many characters don't get their words
+# counted, it'd mean going over all of them every time the selection moves.
+SELECTION_WORDS_LIMIT = 1024 * 1024
+
+
+def count_words(text):
+    return sum(1 for _ in WORD.finditer(text))
+
+
+def get_context(start, end):
+    """
+    Return the characters just before start and just after end, or ""
+    at the start or end of the buffer.
+    """
+    before = start.copy()
+    left = before.get_char() if before.backward_char() else ""
+    right = "" if end.is_end() else end.get_char()
+    return left, right
+
+
+class DocumentStats(object):
+    """
+    Counts the lines, words and characters of a Gtk.TextBuffer.
+
+    on_changed() is called whenever the cursor or the selection move.
+    Edits aren't announced here, umte hears about those from its
+    events.EventBus.
+    """
+
+    def __init__(self, buff, view=None):
+        self.buff = buff
+        self.view = view
+        self.on_changed = None
+
+        start, end = buff.get_bounds()
+        text = buff.get_text(start, end, True)
+        self.chars = len(text)
+        self.lines = text.count("\n") + 1
+        self.words = count_words(text)
+
+        # The default handlers run last, so the iters still point at
+        # where the change is about to happen.
+        buff.connect("insert-text", self.on_insert_text)
+        buff.connect("delete-range", self.on_delete_range)
+        buff.connect("mark-set", self.on_mark_set)
+
+    def get_cursor(self):
+        """Return the line and column of the cursor, counting from 1."""
+        cursor = self.buff.get_iter_at_mark(self.buff.get_insert())
+        if self.view is not None:
+            column = self.view.get_visual_column(cursor)
+        else:
+            column = cursor.get_line_offset()
+        return cursor.get_line() + 1, column + 1
+
+    def get_selection(self):
+        """
+        Return (chars, words, lines) of the selection, or None if nothing
+        is selected. words is None if the selection is too big to count.
+        """
+        bounds = self.buff.get_selection_bounds()
+        if not bounds:
+            return None
+        start, end = bounds
+        chars = end.get_offset() - start.get_offset()
+        lines = end.get_line() - start.get_line() + 1
+        words = None
+        if chars <= SELECTION_WORDS_LIMIT:
+            words = count_words(self.buff.get_text(start, end, True))
+        return chars, words, lines
+
+    def get_indent(self):
+        """Return a description of the indentation, like "Spaces: 4"."""
+        if self.view is None:
+            return ""
+        if self.view.get_insert_spaces_instead_of_tabs():
+            return "Spaces: {}".format(self.view.get_indent_width()
+                                       if self.view.get_indent_width() > 0
+                                       else self.view.get_tab_width())
+        return "Tab width: {}".format(self.view.get_tab_width())
+
+    def changed(self):
+        if self.on_changed is not None:
+            self.on_changed()
+
+    def on_insert_text(self, buff, location, text, length):
+        left, right = get_context(location, location)
+        self.words += (count_words(left + text + right) -
+                       count_words(left + right))
+        self.chars += len(text)
+        self.lines += text.count("\n")
+
+    def on_delete_range(self, buff, start, end):
+        text = buff.get_text(start, end, True)
+        left, right = get_context(start, end)
+        self.words -= (count_words(left + text + right) -
+                       count_words(left + right))
+        self.chars -= len(text)
+        self.lines -= text.count("\n")
+
+    def on_mark_set(self, buff, location, mark):
+        if mark == buff.get_insert() or mark == buff.get_selection_bound():
+            self.changed()
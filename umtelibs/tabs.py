@@ -0,0 +1,197 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/tabs.py
+
+Tabs for having more than one document open at a time.
+
+A tab starts out as just a path and a label. Its buffer and view are
+only made the first time the tab is shown, so opening lots of files at
+once only costs as much as the one that's visible.
+"""
+
+import os
+from gi.repository import Gtk, GtkSource
+from umtelibs.document import Document
+from umtelibs.encoding import FileFormat
+from umtelibs.stats import DocumentStats
+
+
+class Tab(object):
+    """
+    One open document: its buffer, view, path, language and modified
+    state.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.filename = os.path.basename(path) if path is not None else None
+        self.title = ""
+        # The encoding and line endings the file is saved with.
+        self.file_format = FileFormat()
+        # The id of the language to highlight, None to guess it.
+        self.language = None
+        # Counts the changes to the buffer, so a background save can tell
+        # whether the buffer was edited while it was running.
+        self.change_count = 0
+        self.loader = None
+        self.large_view = None
+        # The session.SessionFile this tab was restored from, if any. Its
+        # cursor and scroll position are put back once the file is loaded.
+        self.restore = None
+        # The journal.Journal recording the tab's edits.
+        self.journal = None
+        # The replace.ReplaceAll or transform.Transform running on the
+        # tab, if any.
+        self.replace_all = None
+        # The highlight.WindowHighlighter of a big buffer, if it has one.
+        self.highlighter = None
+        # (line, column) to put the cursor at once the file is loaded,
+        # counting from 1. column may be None.
+        self.goto = None
+
+        # These are made by create_text_area when the tab is first shown.
+        self.buff = None
+        self.text_area = None
+        self.scroll = None
+        self.document = None
+        self.stats = None
+
+        self.page = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        self.label = Gtk.Label()
+
+    def is_loaded(self):
+        """Return True if the tab's buffer and view have been made."""
+        return self.buff is not None
+
+    def create_text_area(self):
+        """Make the buffer and the view for this tab."""
+        self.text_area = GtkSource.View()
+        # Add the text area to a scrolled window
+        self.scroll = Gtk.ScrolledWindow()
+        self.scroll.add(self.text_area)
+        self.buff = GtkSource.Buffer()
+        self.buff.connect('changed', self.on_buffer_changed)
+        self.text_area.set_buffer(self.buff)
+        # A copy of the text that worker threads can read from.
+        self.document = Document()
+        self.document.connect_buffer(self.buff)
+        self.stats = DocumentStats(self.buff, self.text_area)
+
+        self.page.pack_start(self.scroll, True, True, 0)
+        self.page.show_all()
+
+    def update_label(self):
+        """Show the filename on the tab, with a * if it's been modified."""
+        label = self.filename if self.filename is not None else "untitled"
+        if self.get_modified():
+            label = "*" + label
+        self.label.set_text(label)
+
+    def get_modified(self):
+        return self.buff is not None and self.buff.get_modified()
+
+    def is_busy(self):
+        """
+        Return True if the buffer is being loaded or changed in the
+        background, which goes by offsets nothing else may move.
+        """
+        return self.loader is not None or self.replace_all is not None
+
+    def is_blank(self):
+        """Return True if the tab is an empty, untouched, untitled file."""
+        if self.path is not None or self.large_view is not None:
+            return False
+        if self.buff is None:
+            return True
+        return not self.buff.get_modified() and self.buff.get_char_count() == 0
+
+    def on_buffer_changed(self, buff):
+        self.change_count += 1
+
+
+class TabManager(object):
+    """
+    Keeps the tabs in a Gtk.Notebook.
+
+    on_tab_activated(tab) is called whenever a tab is brought to the
+    front, which is where an unloaded tab should be loaded.
+    """
+
+    def __init__(self, on_tab_activated):
+        self.on_tab_activated = on_tab_activated
+        self.current = None
+        # Maps notebook pages to their tabs.
+        self.tabs = {}
+
+        self.notebook = Gtk.Notebook()
+        self.notebook.set_scrollable(True)
+        self.notebook.set_show_border(False)
+        self.notebook.connect("switch-page", self.on_switch_page)
+
+    def add_tab(self, tab, switch=True, position=-1):
+        """
+        Add tab to the notebook at position, the end if it's -1. The tab
+        is brought to the front if switch is True.
+        """
+        self.tabs[tab.page] = tab
+        tab.page.show()
+        tab.label.show()
+        page_num = self.notebook.insert_page(tab.page, tab.label, position)
+        self.notebook.set_tab_reorderable(tab.page, True)
+        self.update_show_tabs()
+        if switch:
+            self.notebook.set_current_page(page_num)
+        return tab
+
+    def remove_tab(self, tab):
+        page_num = self.notebook.page_num(tab.page)
+        if page_num >= 0:
+            self.notebook.remove_page(page_num)
+        del self.tabs[tab.page]
+        if tab is self.current:
+            self.current = None
+        self.update_show_tabs()
+
+    def is_open(self, tab):
+        return tab.page in self.tabs
+
+    def get_tabs(self):
+        """Return the tabs in the order they're shown in."""
+        return [self.tabs[self.notebook.get_nth_page(i)]
+                for i in range(self.notebook.get_n_pages())]
+
+    def find_tab(self, path):
+        """Return the tab that has path open, or None."""
+        real_path = os.path.realpath(path)
+        for tab in self.tabs.values():
+            if tab.path is not None and os.path.realpath(tab.path) == real_path:
+                return tab
+        return None
+
+    def set_current(self, tab):
+        self.notebook.set_current_page(self.notebook.page_num(tab.page))
+
+    def update_show_tabs(self):
+        # Only bother showing the tabs if there's more than one.
+        self.notebook.set_show_tabs(self.notebook.get_n_pages() > 1)
+
+    def on_switch_page(self, notebook, page, page_num):
+        self.current = self.tabs[page]
+        self.on_tab_activated(self.current)
@@ -14,18 +14,187 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from gi.repository import Gtk, Vte, GLib, Gdk
+from gi.repository import Gtk, Vte, GLib, Gdk, Gio
 import os
+import time
+
+# How often the memory readout is updated, in milliseconds.
+READOUT_INTERVAL = 2000
+
+# Roughly how many bytes Vte keeps for each character cell of the
+# scrollback, with its attributes, before compressing it.
+CELL_SIZE = 16
+
+# How many saved scrollbacks to keep, the oldest are removed first.
+MAX_SPILL_FILES = 10
 
 class Term(Vte.Terminal):
-    def __init__(self, program, *args, **kwds):
+    """
+    A terminal running program. Nothing is run until spawn is called, so
+    a terminal that's never shown never costs a process.
+    """
+
+    def __init__(self, program, scrollback_lines=-1, *args, **kwds):
         super(Term, self).__init__(*args, **kwds)
-        self.spawn_sync(
+        self.program = program
+        self.pid = None
+        self.set_allow_bold(True)
+        # -1 keeps every line, 0 none.
+        self.set_scrollback_lines(scrollback_lines)
+
+    def spawn(self, working_directory=None):
+        """Start program in working_directory, without waiting for it."""
+        if working_directory is None:
+            working_directory = os.environ['HOME']
+        try:
+            spawn_async = self.spawn_async
+        except AttributeError:
+            # Vte older than 0.48 can only spawn synchronously.
+            self.spawn_sync(
+                Vte.PtyFlags.DEFAULT,
+                working_directory,
+                [self.program],
+                [],
+                GLib.SpawnFlags.DO_NOT_REAP_CHILD,
+                None,
+                None)
+            return
+        spawn_async(
             Vte.PtyFlags.DEFAULT,
-            os.environ['HOME'],
-            [program],
-            [],
-            GLib.SpawnFlags.DO_NOT_REAP_CHILD,
+            working_directory,
+            [self.program],
             None,
-            None)
-        self.set_allow_bold(True)
+            GLib.SpawnFlags.DEFAULT,
+            None,
+            None,
+            -1,
+            None,
+            self.on_spawned)
+
+    def on_spawned(self, terminal, pid, error, *user_data):
+        if error is not None:
+            print("Unable to start " + self.program + ": " + str(error))
+            return
+        self.pid = pid
+
+    def get_line_count(self):
+        """Return how many lines there are, counting the scrollback."""
+        adjustment = self.get_vadjustment()
+        return int(adjustment.get_upper() - adjustment.get_lower())
+
+    def get_scrollback_size(self):
+        """
+        Estimate how many bytes the scrollback takes, from how many rows
+        and columns it has. It's what scrollback_lines bounds.
+        """
+        rows = max(0, self.get_line_count() - self.get_row_count())
+        return rows * self.get_column_count() * CELL_SIZE
+
+    def save_scrollback(self, path):
+        """Write the scrollback and the screen to path, gzip compressed."""
+        output = Gio.File.new_for_path(path).replace(
+            None, False, Gio.FileCreateFlags.PRIVATE, None)
+        compressor = Gio.ZlibCompressor.new(Gio.ZlibCompressorFormat.GZIP, -1)
+        stream = Gio.ConverterOutputStream.new(output, compressor)
+        try:
+            self.write_contents_sync(stream, Vte.WriteFlags.DEFAULT, None)
+        finally:
+            stream.close(None)
+
+    def clear(self):
+        """Throw away the scrollback and the screen, giving back the memory
+        and the disk space they were using."""
+        self.reset(True, True)
+
+
+def get_rss():
+    """Return the resident memory of umte, in bytes, or None if it can't
+    be found out."""
+    try:
+        with open("/proc/self/status", 'r') as _file:
+            for line in _file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (IOError, ValueError):
+        pass
+    return None
+
+
+class TerminalPane(Gtk.Box):
+    """
+    A Term with a line under it showing how much it holds, an estimate
+    of the memory its scrollback takes and how much umte as a whole
+    uses, and a button to clear it.
+
+    If spill_path is given, the scrollback is saved there, compressed,
+    before it's cleared and when save_scrollback is called.
+    """
+
+    def __init__(self, terminal, spill_path=None, *args, **kwds):
+        super(TerminalPane, self).__init__(*args, **kwds)
+        self.set_orientation(Gtk.Orientation.VERTICAL)
+        self.terminal = terminal
+        self.spill_path = spill_path
+        self.readout_id = None
+
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.add(terminal)
+        footer = Gtk.Box(spacing=4)
+        footer.set_border_width(2)
+        self.readout = Gtk.Label(xalign=0)
+        clear_button = Gtk.Button.new_with_label("Clear")
+        clear_button.set_tooltip_text("Clear the terminal and free its scrollback")
+        clear_button.connect("clicked", self.on_clear_clicked)
+        footer.pack_start(self.readout, True, True, 0)
+        footer.pack_start(clear_button, False, False, 0)
+        self.pack_start(scrolled, True, True, 0)
+        self.pack_start(footer, False, False, 0)
+
+        # The readout is only kept up to date while it can be seen.
+        self.connect("map", self.on_map)
+        self.connect("unmap", self.on_unmap)
+
+    def update_readout(self):
+        text = "{} lines, scrollback about {:.1f} MiB".format(
+            self.terminal.get_line_count(),
+            self.terminal.get_scrollback_size() / (1024 * 1024))
+        memory = get_rss()
+        if memory is not None:
+            text += ", umte using {:.1f} MiB".format(memory / (1024 * 1024))
+        self.readout.set_text(text)
+        return True
+
+    def save_scrollback(self):
+        """Save the scrollback to spill_path, if there is one."""
+        if self.spill_path is None:
+            return
+        path = os.path.join(self.spill_path, time.strftime(
+            "scrollback-%Y%m%d-%H%M%S.txt.gz"))
+        try:
+            self.terminal.save_scrollback(path)
+        except GLib.Error as e:
+            print("Unable to save the scrollback: " + e.message)
+            return
+        names = sorted(name for name in os.listdir(self.spill_path)
+                       if name.startswith("scrollback-"))
+        for name in names[:-MAX_SPILL_FILES]:
+            try:
+                os.unlink(os.path.join(self.spill_path, name))
+            except OSError:
+                pass
+
+    def on_clear_clicked(self, widget, data=None):
+        self.save_scrollback()
+        self.terminal.clear()
+        self.update_readout()
+
+    def on_map(self, widget):
+        self.update_readout()
+        if self.readout_id is None:
+            self.readout_id = GLib.timeout_add(READOUT_INTERVAL,
+                                               self.update_readout)
+
+    def on_unmap(self, widget):
+        if self.readout_id is not None:
+            GLib.source_remove(self.readout_id)
+            self.readout_id = None
@@ -0,0 +1,115 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/textops.py
+
+Plain text transformations used by both the editor and batch mode. None
+of these need Gtk.
+"""
+
+import re
+
+TRAILING_WHITESPACE = re.compile(r"[ \t]+$", re.MULTILINE)
+INDENTATION = re.compile(r"^[ \t]+", re.MULTILINE)
+
+
+def change_case(text):
+    """
+    Take the selection (text) and cycle it through different cases.
+
+    Similar to the extremely useful feature in Microsoft Word,
+    take text, which will be the user's selected text and cycle it
+    through being uppercase, lowercase and title format each time
+    the user runs this function and return the result.
+    """
+    if text.istitle():
+        newtext = text.upper()
+
+    elif text.isupper():
+        newtext = text.lower()
+
+    elif text.islower():
+        newtext = text.title()
+
+    else:
+        # Mixed case, start the cycle over.
+        newtext = text.upper()
+
+    return(newtext)
+
+
+def set_case(text, case):
+    """Return text in case, which is "upper", "lower" or "title"."""
+    if case == "upper":
+        return text.upper()
+    elif case == "lower":
+        return text.lower()
+    elif case == "title":
+        return text.title()
+    raise ValueError("Unknown case: " + case)
+
+
+def strip_trailing_whitespace(text):
+    """Remove the spaces and tabs at the end of every line of text."""
+    return TRAILING_WHITESPACE.sub("", text)
+
+
+def get_next_case(blocks):
+    """
+    Return the case change_case would turn the text made of blocks into:
+    "upper", "lower" or "title". Each block has to be whole lines, so
+    the text can be looked at a block at a time.
+    """
+    # No word goes over a newline, so the text is title, upper or lower
+    # case if every block with letters in it is.
+    title = upper = lower = True
+    cased = False
+    for block in blocks:
+        if block.lower() == block.upper():
+            # Nothing that has a case.
+            continue
+        cased = True
+        title = title and block.istitle()
+        upper = upper and block.isupper()
+        lower = lower and block.islower()
+    if cased and title:
+        return "upper"
+    elif cased and upper:
+        return "lower"
+    elif cased and lower:
+        return "title"
+    return "upper"
+
+
+def expand_tabs(text, tab_width):
+    """Replace the tabs in text, which starts a line, with spaces."""
+    return text.expandtabs(tab_width)
+
+
+def indent_with_tabs(text, tab_width):
+    """Replace the spaces indenting each line of text with tabs."""
+    def replace(match):
+        width = len(match.group().expandtabs(tab_width))
+        return "\t" * (width // tab_width) + " " * (width % tab_width)
+    return INDENTATION.sub(replace, text)
+
+
+def normalize_newlines(text):
+    """Turn "\\r\\n" and lone "\\r" line endings into "\\n"."""
+    return text.replace("\r\n", "\n").replace("\r", "\n")
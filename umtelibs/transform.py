@@ -0,0 +1,207 @@
+"""
+Copyright (C) 2012 Skyler Riske
+
+This program is licensed under the GNU GPLv3, see LICENSE for details.
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+Author(s): Skyler Riske
+
+umtelibs/transform.py
+
+Changing case, trimming whitespace, tabs and line endings of a selection.
+
+Like replace.ReplaceAll, the text is read from a snapshot of the
+document in a worker thread, and the buffer is edited from idle
+callbacks inside one user action, so a single undo puts it back. The
+worker hands over a block of lines at a time through a small queue and
+waits while the queue is full, so only a few blocks of new text are
+held at once however big the selection is.
+"""
+
+import time
+import queue
+import threading
+from gi.repository import GLib
+from umtelibs import textops
+from umtelibs.search import TIME_BUDGET
+
+# How many characters of the selection are transformed at a time.
+BLOCK_SIZE = 64 * 1024
+
+# How many transformed blocks can wait to be put in the buffer.
+QUEUE_BLOCKS = 8
+
+# Put on the queue when the worker is done.
+DONE = None
+
+# The transforms that work on whole lines, so the selection is grown to
+# the start and end of its lines first.
+LINE_TRANSFORMS = ("trim", "expand_tabs", "indent_with_tabs", "newlines")
+
+
+def get_function(name, tab_width):
+    """
+    Return the function that transforms a block of text for name, one
+    of LINE_TRANSFORMS. "case" is handled by Transform itself.
+    """
+    if name == "trim":
+        return textops.strip_trailing_whitespace
+    elif name == "expand_tabs":
+        return lambda text: textops.expand_tabs(text, tab_width)
+    elif name == "indent_with_tabs":
+        return lambda text: textops.indent_with_tabs(text, tab_width)
+    elif name == "newlines":
+        return textops.normalize_newlines
+    raise ValueError("Unknown transform: " + name)
+
+
+class Transform(object):
+    """
+    Transforms the text between two offsets of buff.
+
+    document is the umtelibs.document.Document mirroring buff. While
+    the edits are made on_progress(fraction) is called now and then, and
+    on_done(count, cancelled) is called at the end, count being how many
+    blocks were changed.
+    """
+
+    def __init__(self, buff, document, on_progress, on_done):
+        self.buff = buff
+        self.document = document
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.cancelled = False
+        self.queue = queue.Queue(QUEUE_BLOCKS)
+        self.start_offset = 0
+        self.end_offset = 0
+        # How much longer the text in the buffer is than in the snapshot
+        # up to the last edit.
+        self.delta = 0
+        # Where in the snapshot the last edit ended.
+        self.done_offset = 0
+        # The document as the last edit left it.
+        self.root = None
+        self.count = 0
+        self.source_id = None
+        self.in_user_action = False
+
+    def start(self, name, start, end, tab_width=8):
+        """Start transforming the text between start and end as name."""
+        self.start_offset = start
+        self.end_offset = end
+        snapshot = self.document.snapshot()
+        self.root = snapshot.root
+        if name == "case":
+            function = None
+        else:
+            function = get_function(name, tab_width)
+        self.buff.begin_user_action()
+        self.in_user_action = True
+        thread = threading.Thread(target=self._transform,
+                                  args=(snapshot, function))
+        thread.daemon = True
+        thread.start()
+
+    def _put(self, item):
+        """Queue item for the main loop, waiting for room. Returns False
+        if cancelled meanwhile."""
+        while not self.cancelled:
+            try:
+                self.queue.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            GLib.idle_add(self._wake)
+            return True
+        return False
+
+    def _iter_blocks(self, snapshot):
+        for offset, block in snapshot.iter_lines(self.start_offset,
+                                                 self.end_offset, BLOCK_SIZE):
+            if self.cancelled:
+                return
+            yield offset, block
+
+    def _transform(self, snapshot, function):
+        if function is None:
+            # The case to change to depends on all of the text, so it's
+            # read through once first.
+            case = textops.get_next_case(
+                block for offset, block in self._iter_blocks(snapshot))
+            function = lambda text: textops.set_case(text, case)
+        for offset, block in self._iter_blocks(snapshot):
+            text = function(block)
+            if text != block and \
+                    not self._put((offset, offset + len(block), text)):
+                return
+        self._put(DONE)
+
+    def _wake(self):
+        if self.source_id is None and not self.cancelled:
+            self.source_id = GLib.idle_add(self._apply)
+        return False
+
+    def _apply(self):
+        if self.document.root is not self.root:
+            # Something else edited the buffer, so self.delta is wrong.
+            self.source_id = None
+            self.cancel()
+            return False
+        deadline = time.monotonic() + TIME_BUDGET
+        buff = self.buff
+        while time.monotonic() < deadline:
+            try:
+                edit = self.queue.get_nowait()
+            except queue.Empty:
+                # The worker wakes this up again when there's more.
+                self.source_id = None
+                return False
+            if edit is DONE:
+                self.source_id = None
+                self.finish(False)
+                return False
+            start, end, text = edit
+            start_iter = buff.get_iter_at_offset(start + self.delta)
+            buff.delete(start_iter, buff.get_iter_at_offset(end + self.delta))
+            buff.insert(start_iter, text)
+            self.root = self.document.root
+            self.delta += len(text) - (end - start)
+            self.count += 1
+            self.done_offset = end
+        self.on_progress((self.done_offset - self.start_offset) /
+                         max(1, self.end_offset - self.start_offset))
+        return True
+
+    def finish(self, cancelled):
+        if self.in_user_action:
+            self.buff.end_user_action()
+            self.in_user_action = False
+            if cancelled and self.count:
+                # Take back the part that was done.
+                self.buff.undo()
+            elif not cancelled:
+                # Keep what was transformed selected, to do it again.
+                self.buff.select_range(
+                    self.buff.get_iter_at_offset(self.start_offset),
+                    self.buff.get_iter_at_offset(self.end_offset + self.delta))
+        self.on_done(0 if cancelled else self.count, cancelled)
+
+    def cancel(self):
+        """Stop, leaving the buffer as it was before."""
+        if self.cancelled:
+            return
+        self.cancelled = True
+        if self.source_id is not None:
+            GLib.source_remove(self.source_id)
+            self.source_id = None
+        self.finish(True)